@@ -1,51 +1,45 @@
-from googleapiclient import discovery
-from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
 import json
 import logging
 
+from batching import get_folded_report, group_dates
+from cache import ResponseCache
+from client import build_client
+from fetcher import fetch_shards
+from report_specs import REPORTS, report_request
+from scheduler import RequestScheduler
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 SCOPES = ['https://www.googleapis.com/auth/analytics.readonly']
 KEY_FILE_LOCATION = './client_secrets.json'
-VIEW_ID = '150538750'
+CACHE = ResponseCache()
+SCHEDULER = RequestScheduler()
+WORKERS = 4  # Number of date shards fetched concurrently
 
 
 def initialize_analyticsreporting():
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(KEY_FILE_LOCATION, SCOPES)
-    analytics = discovery.build('analyticsreporting', 'v4', credentials=credentials)
-    return analytics
+    return CACHE.wrap(SCHEDULER.wrap(build_client(KEY_FILE_LOCATION, SCOPES)))
+
+
+def build_request(date):
+    return report_request(REPORTS['all_devices'], date, date)
 
 
 def get_report(analytics, date):
     return analytics.reports().batchGet(
         body={
-            "reportRequests": [
-                {
-                    "viewId": VIEW_ID,
-                    "dateRanges": [{"startDate": date, "endDate": date}],
-                    "metrics": [
-                        {"expression": "ga:users"},
-                        {"expression": "ga:newUsers"},
-                        {"expression": "ga:sessions"},
-                        {"expression": "ga:bounceRate"},
-                        {"expression": "ga:pageviewsPerSession"},
-                        {"expression": "ga:avgSessionDuration"}
-                    ],
-                    "dimensions": [
-                        {"name": "ga:channelGrouping"},
-                        {"name": "ga:deviceCategory"},
-                        {"name": "ga:browser"},
-                        {"name": "ga:operatingSystem"}
-                    ],
-                    "pageSize": 10000  # Adjust this value as necessary
-                }
-            ]
+            "reportRequests": [build_request(date)]
         }
     ).execute()
 
 
+def get_reports(analytics, dates):
+    # Several days of the report in one batchGet, split back into per-day responses
+    return get_folded_report(analytics, build_request(dates[0]), dates)
+
+
 def print_response(response):
     for report in response.get('reports', []):
         columnHeader = report.get('columnHeader', {})
@@ -72,19 +66,18 @@ def generate_date_ranges(start_date, end_date):
 
 def main():
     logging.info("Starting script...")
-    analytics = initialize_analyticsreporting()
     start_date = datetime(2017, 5, 15)
     end_date = datetime(2023, 8, 7)
 
-    for date in generate_date_ranges(start_date, end_date):
-        date_str = date.strftime('%Y-%m-%d')
-        logging.info(f"Fetching data for date: {date_str}")
-
-        response = get_report(analytics, date_str)
+    dates = (date.strftime('%Y-%m-%d') for date in generate_date_ranges(start_date, end_date))
+    batches = fetch_shards(initialize_analyticsreporting, get_reports, group_dates(dates), workers=WORKERS)
+    for date_str, response in ((date, responses[date]) for batch, responses in batches for date in batch):
         print_response(response)
 
         logging.info(f"Finished fetching data for date: {date_str}")
 
+    logging.info(f"Response cache: {CACHE.stats()}")
+    logging.info(f"API quota: {SCHEDULER.stats()}")
     logging.info("Script finished.")
 
 
@@ -1,169 +1,173 @@
-from googleapiclient import discovery
-from oauth2client.service_account import ServiceAccountCredentials
-import csv
-import pandas as pd
-import json
 from datetime import datetime
 import os
 import logging
 
+from archive import RawArchive
+from batching import batch_get, page_reports
+from cache import ResponseCache
+from checkpoint import Checkpoint
+from client import build_client
+from excel_sink import ExcelSink
+from external_sort import sorted_csv_rows, top_csv_rows
+from metrics import RunMetrics, file_size, response_rows
+from pipeline import Pipeline
+from planner import ShardPlanner
+from report_specs import PAGE_EVENT_REPORTS, REPORTS, report_request
+from scheduler import RequestScheduler
+from sinks import CsvSink, ReportDemux
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 SCOPES = ['https://www.googleapis.com/auth/analytics.readonly']
 KEY_FILE_LOCATION = './client_secrets.json'
-VIEW_ID = '150538750'
+CACHE = ResponseCache()
+SCHEDULER = RequestScheduler()
+METRICS = RunMetrics('all_pages_events_full', cache=CACHE, scheduler=SCHEDULER)
 OUTPUT_DIR = '../data/all_pages/'
 JSON_DIR = '../data/all_pages/json/'
+# The numeric columns we expect across the pages and events files
+NUMERIC_COLUMNS = ['ga:pageviews', 'ga:uniquePageviews', 'ga:avgTimeOnPage', 'ga:entrances', 'ga:bounceRate',
+                   'ga:exitRate', 'ga:totalEvents']
+TOP_PAGES = 10000  # Rows in the top pages workbook written next to the full one
 
 def initialize_analyticsreporting():
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(KEY_FILE_LOCATION, SCOPES)
-    analytics = discovery.build('analyticsreporting', 'v4', credentials=credentials)
-    return analytics
-
-def get_report(analytics, start_date, end_date, page_token=None):
-    return analytics.reports().batchGet(
-        body={
-            "reportRequests": [
-                {
-                    "viewId": VIEW_ID,
-                    "dateRanges": [{"startDate": start_date, "endDate": end_date}],
-                    "metrics": [
-                        {"expression": "ga:pageviews"},
-                        {"expression": "ga:uniquePageviews"},
-                        {"expression": "ga:avgTimeOnPage"},
-                        {"expression": "ga:entrances"},
-                        {"expression": "ga:bounceRate"},
-                        {"expression": "ga:exitRate"}
-                    ],
-                    "dimensions": [
-                        {"name": "ga:pagePath"}
-                    ],
-                    "dimensionFilterClauses": [
-                        {
-                            "filters": [
-                                {
-                                    "dimensionName": "ga:pagePath",
-                                    "operator": "REGEXP",
-                                    "not": True,
-                                    "expressions": ["\\?.*"]
-                                }
-                            ]
-                        }
-                    ],
-                    "pageToken": page_token,
-                    "pageSize": 10000  # Adjust this value as necessary
-                },
-                {
-                    "viewId": VIEW_ID,
-                    "dateRanges": [{"startDate": start_date, "endDate": end_date}],
-                    "metrics": [
-                        {"expression": "ga:totalEvents"}
-                    ],
-                    "dimensions": [
-                        {"name": "ga:pagePath"},
-                        {"name": "ga:eventCategory"},
-                        {"name": "ga:eventAction"},
-                        {"name": "ga:eventLabel"}
-                    ],
-                    "pageToken": page_token,
-                    "pageSize": 10000  # Adjust this value as necessary
-                }
-            ]
-        }
-    ).execute()
-
-def write_to_csv(response, file_name, event_file_name):
-    with open(file_name, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        for report in response.get('reports', []):
-            columnHeader = report.get('columnHeader', {})
-            dimensionHeaders = columnHeader.get('dimensions', [])
-            metricHeaders = [entry.get('name') for entry in columnHeader.get('metricHeader', {}).get('metricHeaderEntries', [])]
-
-            # Write headers only if the file is empty
-            if file.tell() == 0:
-                writer.writerow(dimensionHeaders + metricHeaders)
-
-            for row in report.get('data', {}).get('rows', []):
-                dimensions = row.get('dimensions', [])
-                metrics = [value for value in row.get('metrics', [])[0].get('values', [])]
-                writer.writerow(dimensions + metrics)
-
-    with open(event_file_name, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        for report in response.get('reports', []):
-            if report['columnHeader']['dimensions'] == ['ga:pagePath', 'ga:eventCategory', 'ga:eventAction', 'ga:eventLabel']:
-                columnHeader = report.get('columnHeader', {})
-                dimensionHeaders = columnHeader.get('dimensions', [])
-                metricHeaders = [entry.get('name') for entry in columnHeader.get('metricHeader', {}).get('metricHeaderEntries', [])]
-
-                # Write headers only if the file is empty
-                if file.tell() == 0:
-                    writer.writerow(dimensionHeaders + metricHeaders)
-
-                for row in report.get('data', {}).get('rows', []):
-                    dimensions = row.get('dimensions', [])
-                    metrics = [value for value in row.get('metrics', [])[0].get('values', [])]
-                    writer.writerow(dimensions + metrics)
-
-def write_to_json(response, file_name):
-    with open(file_name, 'w', encoding='utf-8') as file:
-        json.dump(response, file, ensure_ascii=False, indent=4)
-
-def process_csv_to_excel(file_name):
+    return CACHE.wrap(SCHEDULER.wrap(build_client(KEY_FILE_LOCATION, SCOPES)))
+
+def get_report(analytics, start_date, end_date):
+    # First page of every report; the same body as the first page_reports() round, so it's cached
+    with METRICS.timer('get_report') as sample:
+        response = analytics.reports().batchGet(
+            body={
+                "reportRequests": [report_request(REPORTS[name], start_date, end_date)
+                                   for name in PAGE_EVENT_REPORTS]
+            }
+        ).execute()
+        sample.rows = response_rows(response)
+    return response
+
+def get_batch(analytics, batch):
+    with METRICS.timer('get_report') as sample:
+        responses = batch_get(analytics, batch)
+        sample.rows = sum(response_rows(response) for response in responses.values())
+    return responses
+
+def process_csv_to_excel(file_name, top=None):
+    """Writes the CSV to a workbook sorted by ga:pageviews, or only its top rows.
+
+    The rows are sorted out of core and streamed into the workbook, so the
+    full six-year tables never have to fit in memory.
+    """
     logging.info(f"Processing CSV to Excel for file: {file_name}")
-    # Read the CSV file
-    df = pd.read_csv(file_name)
-
-    # Define the numeric columns we expect
-    numeric_columns = ['ga:pageviews', 'ga:uniquePageviews', 'ga:avgTimeOnPage', 'ga:entrances', 'ga:bounceRate', 'ga:exitRate', 'ga:totalEvents']
-
-    # Convert columns to numeric, replacing commas and handling errors
-    for column in numeric_columns:
-        if column in df.columns:
-            df[column] = pd.to_numeric(df[column].astype(str).str.replace(',', ''), errors='coerce')
-
-    # If ga:pageviews exists, sort by it
-    if 'ga:pageviews' in df.columns:
-        df = df.sort_values(by='ga:pageviews', ascending=False)
-
-    # Save the DataFrame to an Excel file
-    excel_file_name = file_name.replace('.csv', '.xlsx')
-    df.to_excel(excel_file_name, index=False)
-    logging.info(f"Saved Excel file: {excel_file_name}")
+    if top:
+        header, rows = top_csv_rows(file_name, 'ga:pageviews', top, NUMERIC_COLUMNS)
+        excel_file_name = file_name.replace('.csv', f'_top{top}.xlsx')
+    else:
+        # Sorted only if ga:pageviews exists; the events file streams through as is
+        header, rows = sorted_csv_rows(file_name, 'ga:pageviews', NUMERIC_COLUMNS)
+        excel_file_name = file_name.replace('.csv', '.xlsx')
+
+    # Save the rows to an Excel file, continuing on a new sheet past Excel's row limit
+    excel = ExcelSink(excel_file_name)
+    excel.append('Sheet1', header, rows)
+    excel.close()
 
 def main():
     logging.info("Starting script...")
     analytics = initialize_analyticsreporting()
-    start_date = '2017-05-15'
-    end_date = '2023-08-07'
+    start_date = datetime(2017, 5, 15)
+    end_date = datetime(2023, 8, 7)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     os.makedirs(JSON_DIR, exist_ok=True)
-
-    file_name = f"{OUTPUT_DIR}UniversalAnalytics_AllPages_{start_date}_to_{end_date}.csv"
-    event_file_name = f"{OUTPUT_DIR}UniversalAnalytics_AllPages_Events_{start_date}_to_{end_date}.csv"
-    json_file_name = f"{JSON_DIR}UniversalAnalytics_AllPages_{start_date}_to_{end_date}.json"
-
-    logging.info(f"Fetching data for date range: {start_date} to {end_date}")
-
-    page_token = None
-    while True:
-        response = get_report(analytics, start_date, end_date, page_token)
-        write_to_csv(response, file_name, event_file_name)
-        write_to_json(response, json_file_name)
-
-        # Check if there is another page of data
-        page_token = response.get('reports', [])[0].get('nextPageToken', None)
-        if not page_token:
-            break
-
-    logging.info(f"Finished fetching data for date range: {start_date} to {end_date}")
-
-    # Process the CSV to Excel after fetching all data
-    process_csv_to_excel(file_name)
-    process_csv_to_excel(event_file_name)
-
+    METRICS.total = (end_date - start_date).days + 1
+
+    range_str = f"{start_date:%Y-%m-%d}_to_{end_date:%Y-%m-%d}"
+    checkpoint = Checkpoint('all_pages_events_full')
+    archive = RawArchive(f"{JSON_DIR}UniversalAnalytics_AllPages_{range_str}.ndjson.gz")
+
+    # Ask for the whole range in one go, and only split it up if GA samples it.
+    # Each unsampled sub-range gets its own *_to_* file, which combine.py merges.
+    full_days = (end_date - start_date).days + 1
+    planner = ShardPlanner(lambda start, end: get_report(analytics, start, end),
+                           initial_days=full_days, max_days=full_days)
+
+    def fetch():
+        """Yields ('page', shard, responses, cursors) for every round of pages, then ('fetched', shard)."""
+        for start, end in planner.plan(start_date, end_date):
+            start_str = start.strftime('%Y-%m-%d')
+            end_str = end.strftime('%Y-%m-%d')
+            shard_name = f"{start_str}_to_{end_str}"
+            file_name = f"{OUTPUT_DIR}UniversalAnalytics_AllPages_{shard_name}.csv"
+            event_file_name = f"{OUTPUT_DIR}UniversalAnalytics_AllPages_Events_{shard_name}.csv"
+            shard = {'name': shard_name, 'start': start_str, 'end': end_str, 'days': (end - start).days + 1,
+                     'files': [file_name, event_file_name]}
+
+            if checkpoint.is_done(shard['name']):
+                logging.info(f"Date range already exported: {start_str} to {end_str}")
+                yield 'done', shard
+                continue
+
+            if not checkpoint.is_fetched(shard['name']):
+                logging.info(f"Fetching data for date range: {start_str} to {end_str}")
+
+                cursors = checkpoint.resume(shard['name'], shard['files'])
+                if isinstance(cursors, str):
+                    # Checkpoints from before per-report cursors kept one token for both reports
+                    cursors = dict.fromkeys(PAGE_EVENT_REPORTS, cursors)
+                units = {name: report_request(REPORTS[name], start_str, end_str) for name in PAGE_EVENT_REPORTS}
+                # Each report follows its own nextPageToken and drops out once it has no more pages
+                for responses, cursors in page_reports(analytics, units, cursors, get_batch=get_batch):
+                    yield 'page', shard, responses, cursors or None
+            yield 'fetched', shard
+
+    writers = {}
+
+    def write(item):
+        if item[0] != 'page':
+            return item
+        _, shard, responses, cursors = item
+        if shard['name'] not in writers:
+            # Each report goes to its own file, held open for the whole shard
+            writers[shard['name']] = ReportDemux({name: CsvSink(file_name)
+                                                  for name, file_name in zip(PAGE_EVENT_REPORTS, shard['files'])})
+        writer = writers[shard['name']]
+        response = {'reports': [report for name in PAGE_EVENT_REPORTS if name in responses
+                                for report in responses[name]['reports']]}
+        rows = response_rows(response)
+        with METRICS.timer('write_to_csv', rows=rows) as sample:
+            size = sum(map(file_size, shard['files']))
+            writer.write(responses)
+            # Flushed so the checkpoint records every row of this round
+            writer.flush()
+            sample.bytes = sum(map(file_size, shard['files'])) - size
+        with METRICS.timer('archive', rows=rows) as sample:
+            sample.bytes = archive.append(shard['name'], checkpoint.pages(shard['name']), response)
+        checkpoint.commit_page(shard['name'], cursors, shard['files'])
+        if not cursors:
+            writers.pop(shard['name']).close()
+            logging.info(f"Finished fetching data for date range: {shard['start']} to {shard['end']}")
+
+    def convert(item):
+        if item[0] != 'fetched':
+            return item
+        shard = item[1]
+        # Process the CSV to Excel after fetching all data
+        with METRICS.timer('excel'):
+            process_csv_to_excel(shard['files'][0])
+            process_csv_to_excel(shard['files'][0], top=TOP_PAGES)
+            process_csv_to_excel(shard['files'][1])
+        checkpoint.complete(shard['name'])
+        return 'done', shard
+
+    # The next pages are fetched while earlier ones are written and converted to Excel
+    for _, shard in Pipeline(fetch()).stage('write', write).stage('excel', convert).run():
+        METRICS.progress(shard['days'])
+
+    archive.close()
+    logging.info(f"Planned {range_str} with {planner.calls} probe requests")
+    logging.info(f"Response cache: {CACHE.stats()}")
+    logging.info(f"API quota: {SCHEDULER.stats()}")
+    METRICS.close()
     logging.info("Script finished.")
 
 if __name__ == '__main__':
@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+
+INDEX_SUFFIX = '.idx'
+
+
+def _codec(compression):
+    if compression == 'gzip':
+        return lambda data: gzip.compress(data, compresslevel=6), gzip.decompress
+    if compression == 'zstd':
+        import zstandard  # Optional: pip install zstandard
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def compression_for(file_name):
+    return 'zstd' if file_name.endswith('.zst') else 'gzip'
+
+
+class RawArchive:
+    """Append-only, compressed NDJSON archive of raw API responses.
+
+    Every page is written as one compact JSON line compressed into its own
+    gzip member (or zstd frame). Concatenated members are still a valid
+    .ndjson.gz stream, so `zcat` replays the whole export, while the sidecar
+    index (shard, page -> offset, length) lets read_page() decompress a single
+    page without touching the rest of the file.
+    """
+
+    def __init__(self, file_name, compression=None):
+        self.file_name = file_name
+        self.index_name = file_name + INDEX_SUFFIX
+        self.compress, _ = _codec(compression or compression_for(file_name))
+        index = load_index(file_name)
+        # Drop anything written after the last indexed page, e.g. a page that
+        # was being appended when the previous run died.
+        end = max((entry['offset'] + entry['length'] for entry in index.values()), default=0)
+        if os.path.exists(file_name) and os.path.getsize(file_name) != end:
+            with open(file_name, 'r+b') as file:
+                file.truncate(end)
+        if os.path.exists(self.index_name):
+            with open(self.index_name, 'r+b') as file:
+                content = file.read()
+                if content and not content.endswith(b'\n'):
+                    file.truncate(content.rfind(b'\n') + 1)
+        self.file = open(file_name, 'ab')
+        self.index_file = open(self.index_name, 'a', encoding='utf-8')
+
+    def append(self, shard, page, response):
+        line = json.dumps(response, ensure_ascii=False, separators=(',', ':')) + '\n'
+        data = self.compress(line.encode('utf-8'))
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.flush()
+        entry = {'shard': shard, 'page': page, 'offset': offset, 'length': len(data)}
+        self.index_file.write(json.dumps(entry) + '\n')
+        self.index_file.flush()
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_index(file_name):
+    """Returns {(shard, page): entry} for an archive; later entries win over re-fetched pages."""
+    index = {}
+    try:
+        with open(file_name + INDEX_SUFFIX, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn last line
+                index[(entry['shard'], entry['page'])] = entry
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def read_page(file_name, shard, page, index=None):
+    """Decompresses and returns just one archived response."""
+    entry = (index or load_index(file_name))[(shard, page)]
+    _, decompress = _codec(compression_for(file_name))
+    with open(file_name, 'rb') as file:
+        file.seek(entry['offset'])
+        data = file.read(entry['length'])
+    return json.loads(decompress(data))
+
+
+def iter_pages(file_name):
+    """Yields (shard, page, response) for every indexed page in file order."""
+    index = load_index(file_name)
+    _, decompress = _codec(compression_for(file_name))
+    with open(file_name, 'rb') as file:
+        for entry in sorted(index.values(), key=lambda entry: entry['offset']):
+            file.seek(entry['offset'])
+            yield entry['shard'], entry['page'], json.loads(decompress(file.read(entry['length'])))
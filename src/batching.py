@@ -0,0 +1,173 @@
+import copy
+import json
+from datetime import datetime, timedelta
+
+# The Reporting API v4 accepts at most five reportRequests per batchGet, and
+# all of them must share viewId, dateRanges, samplingLevel, segments and
+# cohortGroup.
+MAX_REPORTS_PER_BATCH = 5
+DATE_DIMENSION = 'ga:date'
+DATA_METADATA_KEYS = ('isDataGolden', 'samplesReadCounts', 'samplingSpaceSizes', 'dataLastRefreshed')
+
+
+def batch_key(request):
+    """Returns the part of a reportRequest that must match within one batchGet."""
+    return json.dumps([request.get(field) for field in
+                       ('viewId', 'dateRanges', 'samplingLevel', 'segments', 'cohortGroup')], sort_keys=True)
+
+
+def pack_requests(units, size=MAX_REPORTS_PER_BATCH):
+    """Groups (unit_id, reportRequest) pairs into batchGet-compatible batches.
+
+    Args:
+      units: Iterable of (unit_id, reportRequest) pairs. unit_id is any
+        hashable the caller uses to route the result, e.g. (report, date).
+      size: Maximum number of reportRequests per batch.
+    Yields:
+      Lists of at most size (unit_id, reportRequest) pairs sharing a batch_key.
+    """
+    open_batches = {}
+    for unit_id, request in units:
+        key = batch_key(request)
+        batch = open_batches.setdefault(key, [])
+        batch.append((unit_id, request))
+        if len(batch) == size:
+            yield open_batches.pop(key)
+    yield from open_batches.values()
+
+
+def batch_get(analytics, batch):
+    """Sends one packed batch and splits the reports back out per unit.
+
+    Returns:
+      Dict of unit_id -> response, where each response has the usual
+      {'reports': [...]} shape with exactly one report.
+    """
+    response = analytics.reports().batchGet(
+        body={"reportRequests": [request for _, request in batch]}
+    ).execute()
+    reports = response.get('reports', [])
+    if len(reports) != len(batch):
+        raise ValueError(f"Expected {len(batch)} reports in batchGet response, got {len(reports)}")
+    return {unit_id: {'reports': [report]} for (unit_id, _), report in zip(batch, reports)}
+
+
+def page_reports(analytics, units, cursors=None, get_batch=batch_get):
+    """Pages several reports through batchGet, each with its own cursor.
+
+    Every round sends one request per report that still has rows left, each
+    with that report's own pageToken, packed into as few batches as
+    possible; a report drops out as soon as it has no nextPageToken, so a
+    short report isn't re-requested while a long one is still paging.
+
+    Args:
+      analytics: An authorized Analytics Reporting API V4 service object.
+      units: Dict of unit_id -> reportRequest without a pageToken.
+      cursors: Dict of unit_id -> pageToken to resume from (None for the
+        first page); defaults to every unit from its first page.
+      get_batch: Callable sending one packed batch, like batch_get().
+    Yields:
+      (responses, cursors) per round: unit_id -> single-report response for
+      the pages fetched, and the cursors still open afterwards (empty once
+      every report is exhausted).
+    """
+    cursors = dict(cursors) if cursors is not None else dict.fromkeys(units)
+    while cursors:
+        requests = [(unit_id, dict(units[unit_id], pageToken=token) if token else units[unit_id])
+                    for unit_id, token in cursors.items()]
+        responses = {}
+        for batch in pack_requests(requests):
+            responses.update(get_batch(analytics, batch))
+        for unit_id, response in responses.items():
+            page_token = response['reports'][0].get('nextPageToken')
+            if page_token:
+                cursors[unit_id] = page_token
+            else:
+                del cursors[unit_id]
+        yield responses, dict(cursors)
+
+
+def group_dates(dates, size=MAX_REPORTS_PER_BATCH):
+    """Chunks an ordered iterable of 'YYYY-MM-DD' strings into runs of up to size consecutive days.
+
+    A gap (e.g. between re-fetched non-golden days and new ones) starts a
+    new group, so a folded request never covers days nobody asked for.
+    """
+    group = []
+    previous = None
+    for date in dates:
+        day = datetime.strptime(date, '%Y-%m-%d')
+        if group and day - previous != timedelta(days=1):
+            yield tuple(group)
+            group = []
+        group.append(date)
+        previous = day
+        if len(group) == size:
+            yield tuple(group)
+            group = []
+    if group:
+        yield tuple(group)
+
+
+def fold_dates(request, dates):
+    """Returns a copy of a single-day reportRequest covering all of dates.
+
+    Because batchGet refuses mixed dateRanges, several days of the same report
+    are packed into one request by widening the range and adding ga:date as
+    the leading dimension; split_by_date() undoes this on the way back.
+    """
+    folded = copy.deepcopy(request)
+    folded['dateRanges'] = [{"startDate": min(dates), "endDate": max(dates)}]
+    folded['dimensions'] = [{"name": DATE_DIMENSION}] + folded.get('dimensions', [])
+    return folded
+
+
+def split_by_date(report, dates):
+    """Demultiplexes a folded report into one single-day response per date.
+
+    Every requested date gets a response, with no rows if GA returned none.
+    The ga:date column is dropped so the per-day outputs look exactly like
+    the ones produced by an unfolded request.
+    """
+    header = copy.deepcopy(report.get('columnHeader', {}))
+    dimension_headers = header.get('dimensions', [])
+    index = dimension_headers.index(DATE_DIMENSION)
+    del dimension_headers[index]
+
+    data = report.get('data', {})
+    rows_by_date = {date: [] for date in dates}
+    for row in data.get('rows', []):
+        dimensions = list(row.get('dimensions', []))
+        raw = dimensions.pop(index)
+        date = f"{raw[:4]}-{raw[4:6]}-{raw[6:]}"
+        rows_by_date.setdefault(date, []).append(dict(row, dimensions=dimensions))
+
+    metadata = {key: data[key] for key in DATA_METADATA_KEYS if key in data}
+    return {
+        date: {'reports': [{'columnHeader': header, 'data': dict(metadata, rows=rows, rowCount=len(rows))}]}
+        for date, rows in rows_by_date.items()
+    }
+
+
+def get_folded_report(analytics, request, dates):
+    """Fetches several days of one report in as few batchGet calls as possible.
+
+    Args:
+      analytics: An authorized Analytics Reporting API V4 service object.
+      request: The single-day reportRequest for the report.
+      dates: Consecutive 'YYYY-MM-DD' strings to fetch.
+    Returns:
+      Dict of date -> single-day response.
+    """
+    folded = fold_dates(request, dates)
+    rows = []
+    while True:
+        response = analytics.reports().batchGet(body={"reportRequests": [folded]}).execute()
+        report = response.get('reports', [])[0]
+        rows.extend(report.get('data', {}).get('rows', []))
+        page_token = report.get('nextPageToken')
+        if not page_token:
+            break
+        folded['pageToken'] = page_token
+    report.setdefault('data', {})['rows'] = rows
+    return split_by_date(report, dates)
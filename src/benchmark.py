@@ -0,0 +1,343 @@
+"""End-to-end throughput benchmark for the export pipeline.
+
+Generates a synthetic all_pages dataset with fake_api at the chosen scale
+and times each stage on it: fetching, JSON decoding, decoding to columns,
+the CSV/archive/Excel/columnar/SQLite sinks, then combine.py, combineJSON.py and
+process_csv_to_excel. Each stage reports seconds, rows/sec and peak RSS.
+Results are saved as JSON, and the run fails if any stage regressed past
+--threshold against the saved baseline for that scale.
+
+    python benchmark.py --scale 1m                  # run and compare to baseline
+    python benchmark.py --scale 1m --save-baseline  # record a new baseline
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from checkpoint import atomic_write_json
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BENCHMARK_DIR = '../data/benchmarks/'
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+STAGES = ['fetch', 'json_decode', 'decode', 'write_to_csv', 'archive', 'excel', 'columnar', 'sqlite',
+          'combine', 'combine_json', 'csv_to_excel']
+# A stage regresses when its rows/sec drops, or its peak RSS grows, by more than this fraction
+THRESHOLD = 0.2
+FILE_PREFIX = 'UniversalAnalytics_AllPages'
+START_DATE = date(2020, 1, 6)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process since the last reset_peak_rss(), in MB."""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux but bytes on macOS, and can't be reset
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def children_rss_mb():
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+
+class Stage:
+    """Accumulates the time spent inside measure() and the rows it handled."""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = 0
+        self.note = None
+
+    @contextmanager
+    def measure(self, rows=0):
+        start = time.perf_counter()
+        yield
+        self.seconds += time.perf_counter() - start
+        self.rows += rows
+
+    def result(self, peak_rss):
+        result = {
+            'seconds': round(self.seconds, 4),
+            'rows': self.rows,
+            'rows_per_sec': round(self.rows / self.seconds, 1) if self.seconds else None,
+            'peak_rss_mb': round(peak_rss, 1),
+        }
+        if self.note:
+            result['note'] = self.note
+        return result
+
+
+class Benchmark:
+    def __init__(self, scale, work_dir, latency=0.0):
+        self.scale = scale
+        self.target_rows = SCALES[scale]
+        self.work_dir = work_dir
+        self.pages_dir = os.path.join(work_dir, 'pages')
+        self.csv_dir = os.path.join(work_dir, 'csv')
+        self.latency = latency
+        self.page_files = []
+        self.dictionary = None
+
+    def dimension_dictionary(self):
+        """The DimensionDictionary every decode interns into, as in the exporters."""
+        if self.dictionary is None:
+            from dimension_dictionary import DimensionDictionary
+            self.dictionary = DimensionDictionary(os.path.join(self.work_dir, 'dimensions'))
+        return self.dictionary
+
+    def pages(self):
+        """Yields (date, response) for every fetched page, loaded outside any timer."""
+        for day, file_name in self.page_files:
+            with open(file_name, encoding='utf-8') as file:
+                yield day, json.load(file)
+
+    def fetch(self, stage):
+        from fake_api import FakeAnalytics
+        from planner import MAX_PAGE_SIZE
+        from report_specs import PAGE_METRICS, report_request
+
+        # One page per day at most, like all_pages; no filter, so row counts are predictable
+        daily_rows = min(self.target_rows, MAX_PAGE_SIZE)
+        spec = {'metrics': PAGE_METRICS, 'dimensions': ['ga:pagePath'], 'page_size': MAX_PAGE_SIZE}
+        api = FakeAnalytics(pages=daily_rows, daily_rows=daily_rows, sample_sessions=float('inf'),
+                            latency=self.latency, today=date(2100, 1, 1))
+        os.makedirs(self.pages_dir, exist_ok=True)
+        day = START_DATE
+        while stage.rows < self.target_rows:
+            day_str = day.strftime('%Y-%m-%d')
+            page_token, page = None, 0
+            while True:
+                body = {'reportRequests': [report_request(spec, day_str, day_str, page_token)]}
+                with stage.measure():
+                    response = api.reports().batchGet(body=body).execute()
+                    content = json.dumps(response)
+                rows = len(response['reports'][0]['data'].get('rows', []))
+                stage.rows += rows
+                file_name = os.path.join(self.pages_dir, f"{day_str}_{page}.json")
+                with open(file_name, 'w', encoding='utf-8') as file:
+                    file.write(content)
+                self.page_files.append((day_str, file_name))
+                page_token = response['reports'][0].get('nextPageToken')
+                page += 1
+                if not page_token:
+                    break
+            day += timedelta(days=1)
+
+    def json_decode(self, stage):
+        for _, file_name in self.page_files:
+            with open(file_name, 'rb') as file:
+                content = file.read()
+            with stage.measure():
+                response = json.loads(content)
+            stage.rows += len(response['reports'][0]['data'].get('rows', []))
+
+    def decode(self, stage):
+        from decode import decode_response
+        for _, response in self.pages():
+            with stage.measure():
+                reports = decode_response(response, self.dimension_dictionary())
+            stage.rows += sum(len(report) for report in reports)
+
+    def write_to_csv(self, stage):
+        from sinks import CsvSink
+        os.makedirs(self.csv_dir, exist_ok=True)
+        for day, response in self.pages():
+            # combine.py expects start_to_end file names
+            file_name = os.path.join(self.csv_dir, f"{FILE_PREFIX}_{day}_to_{day}.csv")
+            with stage.measure(len(response['reports'][0]['data'].get('rows', []))):
+                sink = CsvSink(file_name)
+                for report in response.get('reports', []):
+                    sink.write_report(report)
+                sink.close()
+
+    def archive(self, stage):
+        from archive import RawArchive
+        with RawArchive(os.path.join(self.work_dir, f"{FILE_PREFIX}.ndjson.gz")) as archive:
+            for page, (day, response) in enumerate(self.pages()):
+                with stage.measure(len(response['reports'][0]['data'].get('rows', []))):
+                    archive.append(day, page, response)
+
+    def excel(self, stage):
+        from decode import decode_response
+        from excel_sink import ExcelSink
+        excel = ExcelSink(os.path.join(self.work_dir, f"{FILE_PREFIX}.xlsx"), sort_column='ga:pageviews')
+        for day, response in self.pages():
+            reports = decode_response(response, self.dimension_dictionary())
+            with stage.measure(sum(len(report) for report in reports)):
+                excel.write_reports(day, reports)
+        with stage.measure():
+            excel.close()
+
+    def columnar(self, stage):
+        from columnar import ColumnarWriter
+        from decode import decode_response
+        columns = ColumnarWriter(os.path.join(self.work_dir, 'columnar'), 'all_pages')
+        for day, response in self.pages():
+            reports = decode_response(response, self.dimension_dictionary())
+            with stage.measure(sum(len(report) for report in reports)):
+                columns.write_reports(day, reports)
+        with stage.measure():
+            columns.close()
+
+    def sqlite(self, stage):
+        from decode import decode_response
+        from sqlite_sink import SqliteSink
+        database = SqliteSink('all_pages', os.path.join(self.work_dir, 'ua_reports.sqlite'))
+        for day, response in self.pages():
+            reports = decode_response(response, self.dimension_dictionary())
+            with stage.measure(sum(len(report) for report in reports)):
+                database.write_reports(day, reports)
+        with stage.measure():
+            database.close()
+
+    def combined_csv(self):
+        return os.path.join(self.work_dir, 'combined_analytics.csv')
+
+    def combine(self, stage):
+        import combine
+        from metrics import RunMetrics
+        combine.input_dir = self.csv_dir
+        combine.output_file = self.combined_csv()
+        combine.manifest_file = combine.output_file + '.manifest.json'
+        # Not ../data/metrics/, where the textfile collector would take it for a real combine run
+        combine.METRICS = RunMetrics('combine', os.path.join(self.work_dir, 'metrics'))
+        with stage.measure():
+            combine.main()
+        stage.rows = count_lines(combine.output_file) - 1
+
+    def combine_json(self, stage):
+        from combineJSON import convert
+        with stage.measure(count_lines(self.combined_csv()) - 1):
+            convert(self.combined_csv(), os.path.join(self.work_dir, 'combined_analytics.ndjson'), ndjson=True)
+
+    def csv_to_excel(self, stage):
+        from all_pages_events import process_csv_to_excel
+        from excel_sink import MAX_EXCEL_ROWS
+        rows = count_lines(self.combined_csv()) - 1
+        if rows >= MAX_EXCEL_ROWS:
+            stage.note = f"skipped: {rows} rows don't fit on one Excel sheet"
+            return
+        with stage.measure(rows):
+            process_csv_to_excel(self.combined_csv())
+
+    def run(self, stages):
+        results = {}
+        for name in STAGES:
+            if name not in stages:
+                continue
+            if name != 'fetch' and not self.page_files:
+                raise ValueError("The fetch stage must run first; every other stage reads its pages")
+            stage = Stage(name)
+            reset_peak_rss()
+            children_before = children_rss_mb()
+            getattr(self, name)(stage)
+            peak = peak_rss_mb()
+            # Process pools (combine.py) show up as children; only count them if they grew this stage
+            if children_rss_mb() > children_before:
+                peak = max(peak, children_rss_mb())
+            results[name] = stage.result(peak)
+            logging.info(f"{name}: {results[name]}")
+        return results
+
+
+def count_lines(file_name):
+    with open(file_name, 'rb') as file:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: file.read(1 << 20), b''))
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Returns a description of every stage that regressed past threshold against baseline."""
+    regressions = []
+    for name, result in results['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if not before:
+            continue
+        if before.get('rows_per_sec') and result.get('rows_per_sec') \
+                and result['rows_per_sec'] < before['rows_per_sec'] * (1 - threshold):
+            regressions.append(f"{name}: {result['rows_per_sec']} rows/sec, baseline {before['rows_per_sec']}")
+        if before.get('peak_rss_mb') and result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']} MB, baseline {before['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the export pipeline.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help="Stages to run (fetch always runs, since the others read its output)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated API latency per call, in seconds")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="Allowed fractional slowdown or RSS growth before a stage counts as regressed")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against (default: the saved one for --scale)")
+    parser.add_argument('--save-baseline', action='store_true', help="Save this run as the baseline for --scale")
+    parser.add_argument('--output', help="Where to write the results JSON")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated files")
+    args = parser.parse_args()
+
+    work_dir = os.path.join(BENCHMARK_DIR, f"work_{args.scale}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    stages = set(args.stages) | {'fetch'}
+    logging.info(f"Benchmarking {', '.join(s for s in STAGES if s in stages)} at {args.scale} rows")
+    try:
+        stage_results = Benchmark(args.scale, work_dir, args.latency).run(stages)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'scale': args.scale,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'stages': stage_results,
+    }
+    output = args.output or os.path.join(BENCHMARK_DIR, f"{args.scale}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    atomic_write_json(results, output, indent=2)
+    logging.info(f"Results saved to {output}")
+
+    baseline_file = args.baseline or os.path.join(BENCHMARK_DIR, f"baseline_{args.scale}.json")
+    if args.save_baseline:
+        atomic_write_json(results, baseline_file, indent=2)
+        logging.info(f"Baseline saved to {baseline_file}")
+        return
+    if not os.path.exists(baseline_file):
+        logging.info(f"No baseline at {baseline_file}; run with --save-baseline to record one")
+        return
+    with open(baseline_file, encoding='utf-8') as file:
+        regressions = compare(results, json.load(file), args.threshold)
+    for regression in regressions:
+        logging.error(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    logging.info("No stage regressed past the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+CACHE_DIR = '../data/cache/'
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+# GA keeps reprocessing recent days, so responses that touch them (or that GA
+# flags with isDataGolden: false) are only kept for RECENT_TTL seconds.
+GOLDEN_AFTER_DAYS = 3
+RECENT_TTL = 6 * 60 * 60
+
+DAYS_AGO_REGEX = re.compile(r'^(\d+)daysAgo$')
+ABSOLUTE_DATE_REGEX = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def canonical_body(body):
+    """Returns a stable JSON encoding of a batchGet body, ignoring unset fields."""
+    def strip(value):
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items() if item is not None}
+        if isinstance(value, list):
+            return [strip(item) for item in value]
+        return value
+    return json.dumps(strip(body), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def parse_api_date(value, today=None):
+    """Turns a dateRanges value ('YYYY-MM-DD', 'today', 'NdaysAgo', ...) into a date."""
+    today = today or date.today()
+    if value == 'today':
+        return today
+    if value == 'yesterday':
+        return today - timedelta(days=1)
+    match = DAYS_AGO_REGEX.match(value)
+    if match:
+        return today - timedelta(days=int(match.group(1)))
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of batchGet responses.
+
+    Entries live in cache_dir/<xx>/<sha256>.json, keyed by the hash of the
+    canonical request body (viewId, dateRanges, metrics, dimensions, filters,
+    pageToken, ...). File mtimes double as LRU timestamps: hits touch the
+    entry and the oldest entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, golden_after_days=GOLDEN_AFTER_DAYS,
+                 recent_ttl=RECENT_TTL, bypass=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.golden_after_days = golden_after_days
+        self.recent_ttl = recent_ttl
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def key(self, body):
+        return hashlib.sha256(canonical_body(body).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def ttl_for(self, body, response):
+        """Returns how long an entry may be served, or None if it never expires."""
+        if any(not report.get('data', {}).get('isDataGolden', True) for report in response.get('reports', [])):
+            return self.recent_ttl
+        cutoff = date.today() - timedelta(days=self.golden_after_days)
+        for request in body.get('reportRequests', []):
+            for date_range in request.get('dateRanges', []):
+                # Relative ranges ('400daysAgo', 'today') shift every day, so the key alone can't pin them.
+                if not ABSOLUTE_DATE_REGEX.match(date_range['startDate']) or \
+                        not ABSOLUTE_DATE_REGEX.match(date_range['endDate']):
+                    return self.recent_ttl
+                if parse_api_date(date_range['endDate']) >= cutoff:
+                    return self.recent_ttl
+        return None
+
+    def get(self, body):
+        path = self.path(self.key(body))
+        if self.bypass:
+            self._count(hit=False)
+            return None
+        try:
+            with open(path, encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+        if entry['expires'] is not None and entry['expires'] < time.time():
+            self._count(hit=False)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count(hit=True)
+        return entry['response']
+
+    def put(self, body, response):
+        ttl = self.ttl_for(body, response)
+        entry = {'expires': None if ttl is None else time.time() + ttl, 'response': response}
+        path = self.path(self.key(body))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(entry, file, ensure_ascii=False, separators=(',', ':'))
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        with self._lock:
+            self._grow(os.path.getsize(path) - old_size)
+
+    def execute(self, analytics, body):
+        """Serves a batchGet from the cache, falling back to the API on a miss."""
+        response = self.get(body)
+        if response is None:
+            response = analytics.reports().batchGet(body=body).execute()
+            self.put(body, response)
+        return response
+
+    def wrap(self, analytics):
+        """Returns analytics with every reports().batchGet().execute() going through the cache."""
+        return CachedAnalytics(analytics, self)
+
+    def stats(self):
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _grow(self, delta):
+        # Caller holds self._lock
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += delta
+        if self._size <= self.max_bytes:
+            return
+        for _, size, path in sorted(self._entries()):
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+        logging.info(f"Evicted cache entries down to {self._size} bytes")
+
+
+class CachedAnalytics:
+    """Drop-in stand-in for the analyticsreporting service that reads through a ResponseCache."""
+
+    def __init__(self, analytics, cache):
+        self.analytics = analytics
+        self.cache = cache
+
+    def reports(self):
+        return self
+
+    def batchGet(self, body):
+        # Snapshot the body now; callers reuse and mutate request dicts between pages.
+        return CachedRequest(self, json.loads(json.dumps(body)))
+
+
+class CachedRequest:
+    def __init__(self, client, body):
+        self.client = client
+        self.body = body
+
+    def execute(self):
+        return self.client.cache.execute(self.client.analytics, self.body)
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import threading
+
+CHECKPOINT_DIR = '../data/checkpoints/'
+
+
+def atomic_write_json(data, file_name, **kwargs):
+    """Writes JSON to a temp file, fsyncs it and renames it over file_name."""
+    temp_name = f"{file_name}.tmp"
+    with open(temp_name, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, **kwargs)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_name, file_name)
+
+
+class Checkpoint:
+    """Manifest of completed shards and committed pages for a resumable export.
+
+    For every shard the manifest records the nextPageToken of the last page
+    that was fully written and the byte size of each output file at that
+    point. On restart, files are truncated back to those sizes, which drops
+    any rows from a page that was only partially appended before the crash,
+    and the export continues from the recorded page token.
+    """
+
+    def __init__(self, name, checkpoint_dir=CHECKPOINT_DIR):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        # Pipelined exports commit pages and complete shards from different threads
+        self.lock = threading.RLock()
+        self.file_name = os.path.join(checkpoint_dir, f"{name}.json")
+        try:
+            with open(self.file_name, encoding='utf-8') as file:
+                self.manifest = json.load(file)
+        except FileNotFoundError:
+            self.manifest = {'shards': {}}
+
+    def is_done(self, shard):
+        return self.manifest['shards'].get(shard, {}).get('done', False)
+
+    def is_fetched(self, shard):
+        return self.manifest['shards'].get(shard, {}).get('fetched', False)
+
+    def pages(self, shard):
+        return self.manifest['shards'].get(shard, {}).get('pages', 0)
+
+    def resume(self, shard, file_names):
+        """Rolls output files back to the last commit and returns the page token to continue from."""
+        state = self.manifest['shards'].get(shard, {})
+        sizes = state.get('sizes', {})
+        for file_name in file_names:
+            committed = sizes.get(file_name, 0)
+            if os.path.exists(file_name) and os.path.getsize(file_name) != committed:
+                logging.info(f"Rolling {file_name} back to {committed} bytes")
+                with open(file_name, 'r+b') as file:
+                    file.truncate(committed)
+        if state.get('page_token'):
+            logging.info(f"Resuming {shard} after {state['pages']} committed pages")
+        return state.get('page_token')
+
+    def commit_page(self, shard, next_page_token, file_names):
+        """Records that a page was fully written.
+
+        next_page_token is the token (or a dict of per-report tokens) to
+        continue from, and None or empty after the last page.
+        """
+        sizes = {}
+        for file_name in file_names:
+            if os.path.exists(file_name):
+                with open(file_name, 'rb') as file:
+                    os.fsync(file.fileno())
+                sizes[file_name] = os.path.getsize(file_name)
+        with self.lock:
+            state = self.manifest['shards'].setdefault(shard, {'pages': 0})
+            state.update(page_token=next_page_token, sizes=sizes, pages=state['pages'] + 1,
+                         fetched=not next_page_token)
+            self.save()
+
+    def complete(self, shard):
+        with self.lock:
+            self.manifest['shards'].setdefault(shard, {})['done'] = True
+            self.save()
+
+    def save(self):
+        with self.lock:
+            atomic_write_json(self.manifest, self.file_name, indent=1)
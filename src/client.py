@@ -0,0 +1,95 @@
+import json
+import logging
+import os
+import threading
+import time
+
+KEY_FILE_LOCATION = './client_secrets.json'
+SCOPES = ['https://www.googleapis.com/auth/analytics.readonly']
+DISCOVERY_FILE = '../data/discovery/analyticsreporting_v4.json'
+DISCOVERY_URL = 'https://analyticsreporting.googleapis.com/$discovery/rest?version=v4'
+HTTP_TIMEOUT = 120
+# Set to a fake_api.py server URL (e.g. http://127.0.0.1:8765/) to run offline against it
+FAKE_API_ENV = 'UA_FAKE_API'
+
+_lock = threading.Lock()
+_credentials = {}
+_document = None
+_local = threading.local()
+_cold_start_logged = False
+
+
+def startup_seconds():
+    """Wall-clock seconds since this process started (CPU seconds where /proc isn't available)."""
+    try:
+        with open('/proc/self/stat') as file:
+            start_ticks = int(file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as file:
+            uptime = float(file.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.process_time()
+
+
+def discovery_document():
+    """Returns the parsed analyticsreporting v4 discovery document, parsing it once per process.
+
+    The document is read from DISCOVERY_FILE; on first use it is seeded from
+    the copy bundled with google-api-python-client, or downloaded if that is
+    missing, so building a client never hits the network for it again.
+    """
+    global _document
+    with _lock:
+        if _document is None:
+            if not os.path.exists(DISCOVERY_FILE):
+                from googleapiclient import discovery_cache
+                content = discovery_cache.get_static_doc('analyticsreporting', 'v4')
+                if content is None:
+                    import httplib2
+                    _, content = httplib2.Http(timeout=HTTP_TIMEOUT).request(DISCOVERY_URL)
+                    content = content.decode('utf-8')
+                os.makedirs(os.path.dirname(DISCOVERY_FILE), exist_ok=True)
+                with open(DISCOVERY_FILE, 'w', encoding='utf-8') as file:
+                    file.write(content)
+            with open(DISCOVERY_FILE, encoding='utf-8') as file:
+                _document = json.load(file)
+        return _document
+
+
+def credentials(key_file=KEY_FILE_LOCATION, scopes=SCOPES):
+    """Loads service account credentials once per key file and shares them, and their token, process-wide."""
+    key = (key_file, tuple(scopes))
+    with _lock:
+        if key not in _credentials:
+            from oauth2client.service_account import ServiceAccountCredentials
+            _credentials[key] = ServiceAccountCredentials.from_json_keyfile_name(key_file, scopes)
+        return _credentials[key]
+
+
+def build_client(key_file=KEY_FILE_LOCATION, scopes=SCOPES):
+    """Returns this thread's authorized analyticsreporting v4 service, building it on first use.
+
+    httplib2.Http isn't thread-safe, so each thread gets its own service with
+    its own keep-alive connection, all sharing one set of credentials so the
+    OAuth token is fetched and refreshed once for the whole process.
+    """
+    global _cold_start_logged
+    clients = getattr(_local, 'clients', None)
+    if clients is None:
+        clients = _local.clients = {}
+    key = (key_file, tuple(scopes))
+    if key not in clients:
+        import httplib2
+        from googleapiclient import discovery
+        fake_url = os.environ.get(FAKE_API_ENV)
+        if fake_url:
+            document = dict(discovery_document(), rootUrl=fake_url, baseUrl=fake_url)
+            clients[key] = discovery.build_from_document(document, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        else:
+            http = credentials(key_file, scopes).authorize(httplib2.Http(timeout=HTTP_TIMEOUT))
+            clients[key] = discovery.build_from_document(discovery_document(), http=http)
+        with _lock:
+            if not _cold_start_logged:
+                _cold_start_logged = True
+                logging.info(f"Cold start: first client ready {startup_seconds():.2f}s after process start")
+    return clients[key]
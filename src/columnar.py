@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from decode import METRIC_DTYPES
+
+COLUMNAR_DIR = '../data/columnar/'
+SCHEMA_FILE = '_schema.json'
+
+
+def column_file(name):
+    """Maps a GA column name to a portable file stem ('ga:pageviews' -> 'ga_pageviews')."""
+    return name.replace(':', '_')
+
+
+class ColumnarWriter:
+    """Writes report rows as month-partitioned NumPy column files.
+
+    Layout: root/<report>/month=YYYY-MM/ holding date.npy (datetime64[D]),
+    one <metric>.npy per metric (int64 for INTEGER metrics, float64 for the
+    rest) and, for each dimension, <dim>.codes.npy (int32) plus
+    <dim>.dict.json with the distinct values. _schema.json records the
+    column names and types. Rows are buffered for the current month and the
+    partition is rewritten when the month changes or on close(), keeping any
+    stored days this run didn't fetch, so shards must arrive in date order.
+    Reports decoded with a DimensionDictionary are buffered as their int32
+    IDs, and each partition's dictionary is taken from those IDs rather
+    than by sorting strings.
+    """
+
+    def __init__(self, root, report_name):
+        self.directory = os.path.join(root, report_name)
+        self.month = None
+        self.schema = None
+        self.dictionary = None
+        self._reset()
+
+    def _reset(self):
+        self.dates = []
+        self.chunks = []
+
+    def write_reports(self, date, reports):
+        """Buffers decoded single-day reports (see decode.py) for the current month."""
+        month = date[:7]
+        if month != self.month:
+            self.flush()
+            self.month = month
+        for report in reports:
+            if report.dictionary is not None:
+                self.dictionary = report.dictionary
+            if self.schema is None:
+                self.schema = {
+                    'dimensions': list(report.dimensions),
+                    'metrics': [{'name': name, 'type': metric_type} for name, metric_type in
+                                report.metric_types.items()]
+                }
+            if len(report):
+                self.dates.append(np.full(len(report), date, dtype='datetime64[D]'))
+                self.chunks.append({name: report.column(name) for name in report.columns})
+
+    def flush(self):
+        if self.month is None or self.schema is None:
+            return
+        partition = os.path.join(self.directory, f"month={self.month}")
+        self._merge_existing(partition)
+        temp_partition = partition + '.tmp'
+        shutil.rmtree(temp_partition, ignore_errors=True)
+        os.makedirs(temp_partition)
+
+        def concat(name, dtype):
+            return np.concatenate([chunk[name] for chunk in self.chunks]) if self.chunks else np.array([], dtype=dtype)
+
+        dates = np.concatenate(self.dates) if self.dates else np.array([], dtype='datetime64[D]')
+        np.save(os.path.join(temp_partition, 'date.npy'), dates)
+        for name in self.schema['dimensions']:
+            if self.dictionary is not None:
+                ids, codes = np.unique(concat(name, np.int32), return_inverse=True)
+                dictionary = self.dictionary.decode(name, ids)
+            else:
+                dictionary, codes = np.unique(concat(name, object).astype(str), return_inverse=True)
+            np.save(os.path.join(temp_partition, f"{column_file(name)}.codes.npy"), codes.astype(np.int32))
+            with open(os.path.join(temp_partition, f"{column_file(name)}.dict.json"), 'w', encoding='utf-8') as file:
+                json.dump(dictionary.tolist(), file, ensure_ascii=False)
+        for metric in self.schema['metrics']:
+            dtype = METRIC_DTYPES.get(metric['type'], np.float64)
+            np.save(os.path.join(temp_partition, f"{column_file(metric['name'])}.npy"),
+                    concat(metric['name'], dtype).astype(dtype))
+        with open(os.path.join(temp_partition, SCHEMA_FILE), 'w', encoding='utf-8') as file:
+            json.dump(self.schema, file)
+
+        shutil.rmtree(partition, ignore_errors=True)
+        os.replace(temp_partition, partition)
+        logging.info(f"Wrote {len(dates)} rows to {partition}")
+        self._reset()
+
+    def _merge_existing(self, partition):
+        # Keep rows for days of this month that this run didn't fetch, so a
+        # partial month (e.g. a resumed or incremental run) doesn't drop data.
+        if not os.path.exists(partition):
+            return
+        frame = read_partition(partition)
+        fetched = np.unique(np.concatenate(self.dates)) if self.dates else np.array([], dtype='datetime64[D]')
+        frame = frame[~frame['date'].isin(fetched)]
+        self.dates.insert(0, frame['date'].to_numpy().astype('datetime64[D]'))
+        if self.dictionary is not None:
+            chunk = {name: self.dictionary.encode(name, frame[name].cat.categories.tolist())[frame[name].cat.codes.to_numpy()]
+                     for name in self.schema['dimensions']}
+        else:
+            chunk = {name: frame[name].astype(str).to_numpy(dtype=object) for name in self.schema['dimensions']}
+        chunk.update({metric['name']: frame[metric['name']].to_numpy() for metric in self.schema['metrics']})
+        self.chunks.insert(0, chunk)
+
+    def close(self):
+        self.flush()
+
+
+def partitions(root, report_name, start_month=None, end_month=None):
+    directory = os.path.join(root, report_name)
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith('month=') or name.endswith('.tmp'):
+            continue
+        month = name[len('month='):]
+        if (start_month and month < start_month) or (end_month and month > end_month):
+            continue
+        yield os.path.join(directory, name)
+
+
+def read_partition(partition, columns=None):
+    """Loads one partition as a DataFrame, decoding dimensions to Categoricals."""
+    import pandas as pd
+
+    with open(os.path.join(partition, SCHEMA_FILE), encoding='utf-8') as file:
+        schema = json.load(file)
+    metric_names = [metric['name'] for metric in schema['metrics']]
+    data = {}
+    for name in columns or ['date'] + schema['dimensions'] + metric_names:
+        stem = os.path.join(partition, column_file(name))
+        if name == 'date':
+            data[name] = np.load(os.path.join(partition, 'date.npy'))
+        elif name in schema['dimensions']:
+            with open(f"{stem}.dict.json", encoding='utf-8') as file:
+                dictionary = json.load(file)
+            data[name] = pd.Categorical.from_codes(np.load(f"{stem}.codes.npy"), categories=dictionary)
+        elif name in metric_names:
+            data[name] = np.load(f"{stem}.npy")
+        else:
+            raise KeyError(f"Unknown column {name} in {partition}")
+    return pd.DataFrame(data)
+
+
+def read_columns(root, report_name, columns=None, start_month=None, end_month=None):
+    """Loads only the requested columns of a report as a pandas DataFrame.
+
+    Only the partitions between start_month and end_month ('YYYY-MM') and the
+    column files that were asked for are read. Dimensions come back as
+    Categoricals built straight from the stored codes; metrics keep their dtypes.
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    frames = [read_partition(partition, columns) for partition in
+              partitions(root, report_name, start_month, end_month)]
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    combined = {}
+    for name in frames[0].columns:
+        if isinstance(frames[0][name].dtype, pd.CategoricalDtype):
+            combined[name] = union_categoricals([frame[name] for frame in frames], ignore_order=True)
+        else:
+            combined[name] = np.concatenate([frame[name].to_numpy() for frame in frames])
+    return pd.DataFrame(combined)
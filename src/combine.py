@@ -1,39 +1,151 @@
 import pandas as pd
 import os
 import re
+import csv
+import json
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from checkpoint import atomic_write_json
+from metrics import RunMetrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Directory containing the CSV files
 input_dir = '../data/all_pages'
 output_file = '../combined_analytics.csv'
+manifest_file = output_file + '.manifest.json'
+WORKERS = os.cpu_count() or 4
+METRICS = RunMetrics('combine')
 
 # Regular expression to extract date ranges from filenames
 date_range_regex = re.compile(r'(\d{4}-\d{2}-\d{2})_to_(\d{4}-\d{2}-\d{2})')
 
-# List to hold individual DataFrames
-dfs = []
+# Explicit dtypes so pandas doesn't have to infer them per file
+INTEGER_COLUMNS = ['ga:pageviews', 'ga:uniquePageviews', 'ga:entrances', 'ga:totalEvents']
+FLOAT_COLUMNS = ['ga:avgTimeOnPage', 'ga:bounceRate', 'ga:exitRate']
+DATE_COLUMNS = ['start_date', 'end_date']
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def read_header(path):
+    with open(path, newline='', encoding='utf-8') as file:
+        return next(csv.reader(file), [])
+
+
+def union_columns(columns, paths):
+    columns = list(columns)
+    for path in paths:
+        columns += [column for column in read_header(path) + DATE_COLUMNS if column not in columns]
+    return columns
+
+
+def compact_integers(column):
+    """Returns column in the smallest integer dtype that holds it, nullable if it has gaps."""
+    if not column.isna().any():
+        return pd.to_numeric(column, downcast='integer')
+    # Float metrics stay float64: float32 would change the decimals written out
+    return column.astype('Int32' if column.abs().max() < 2 ** 31 else 'Int64')
+
+
+def read_shard(path):
+    """Parses one CSV with compact dtypes and tags it with its date range."""
+    start_date, end_date = date_range_regex.search(os.path.basename(path)).groups()
+    header = read_header(path)
+    dtype = {column: 'str' for column in header}
+    dtype.update({column: 'float64' for column in INTEGER_COLUMNS + FLOAT_COLUMNS if column in header})
+    df = pd.read_csv(path, dtype=dtype, thousands=',')
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = compact_integers(df[column])
+
+    # Add the date range columns; one value per file, so categorical is nearly free
+    df['start_date'] = pd.Categorical([start_date] * len(df))
+    df['end_date'] = pd.Categorical([end_date] * len(df))
+    return df
+
+
+def read_shards(paths, workers=WORKERS):
+    """Parses paths on a process pool and yields (path, frame) in order.
+
+    Only workers * 2 files are submitted ahead of the consumer, like
+    fetcher.fetch_shards(), so parsed frames waiting to be written can't
+    pile up in memory when the disk is slower than the parsers.
+    """
+    window = max(1, workers) * 2
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        try:
+            for path in paths:
+                pending.append((path, pool.submit(read_shard, path)))
+                if len(pending) >= window:
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            while pending:
+                path, future = pending.popleft()
+                yield path, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def load_manifest():
+    try:
+        with open(manifest_file, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {'columns': [], 'files': {}, 'size': 0}
+
+
+def main():
+    manifest = load_manifest()
+
+    # Loop through all files in the input directory
+    shards = {}
+    for filename in sorted(os.listdir(input_dir)):
+        if filename.endswith('.csv') and date_range_regex.search(filename):
+            path = os.path.join(input_dir, filename)
+            shards[path] = file_signature(path)
 
-# Loop through all files in the input directory
-for filename in os.listdir(input_dir):
-    if filename.endswith('.csv'):
-        # Extract the date range from the filename
-        match = date_range_regex.search(filename)
-        if match:
-            start_date, end_date = match.groups()
+    new_paths = [path for path in shards if path not in manifest['files']]
+    columns = union_columns(manifest['columns'], new_paths)
 
-            # Read the CSV file into a DataFrame
-            df = pd.read_csv(os.path.join(input_dir, filename))
+    # Appending is only safe if every file already merged is unchanged and the
+    # column layout still fits; otherwise rebuild the combined file from scratch.
+    unchanged = all(shards.get(path) == signature for path, signature in manifest['files'].items())
+    if unchanged and columns == manifest['columns'] and os.path.exists(output_file):
+        # Drop rows appended after the last manifest update, e.g. by a crashed run
+        with open(output_file, 'r+b') as file:
+            file.truncate(manifest['size'])
+    else:
+        logging.info("Rebuilding combined file from scratch")
+        columns = union_columns([], shards)
+        with open(output_file, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerow(columns)
+        manifest = {'columns': columns, 'files': {}, 'size': os.path.getsize(output_file)}
 
-            # Add the date range columns
-            df['start_date'] = start_date
-            df['end_date'] = end_date
+    pending = [path for path in shards if path not in manifest['files']]
+    logging.info(f"Merging {len(pending)} new files ({len(manifest['files'])} already merged)")
+    METRICS.total = len(pending)
 
-            # Append the DataFrame to the list
-            dfs.append(df)
+    # Parse in a process pool and stream each result to the output as it arrives
+    for path, df in read_shards(pending):
+        with METRICS.timer('combine', rows=len(df)) as sample:
+            df.reindex(columns=columns).to_csv(output_file, mode='a', header=False, index=False)
+            sample.bytes = os.path.getsize(output_file) - manifest['size']
+        manifest['files'][path] = shards[path]
+        manifest['size'] = os.path.getsize(output_file)
+        atomic_write_json(manifest, manifest_file)
+        METRICS.progress()
 
-# Combine all DataFrames into a single DataFrame
-combined_df = pd.concat(dfs, ignore_index=True)
+    METRICS.close()
+    print(f"Combined CSV file saved to {output_file}")
 
-# Save the combined DataFrame to a new CSV file
-combined_df.to_csv(output_file, index=False)
 
-print(f"Combined CSV file saved to {output_file}")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
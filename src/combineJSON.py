@@ -1,19 +1,69 @@
 import pandas as pd
-import json
+import gzip
+
+from report_specs import REPORTS
 
 # Input CSV file
 input_csv = '../combined_analytics.csv'
 # Output JSON file
 output_json = './combined_analytics.json'
+# Write one record per line (NDJSON) instead of a single JSON array
+NDJSON = False
+# gzip the output (appends .gz to the file name)
+GZIP_OUTPUT = False
+CHUNK_SIZE = 100000
+# Every metric the exporters pull; only these columns are parsed as numbers,
+# so a dimension such as an event label of "1,500" stays text
+METRIC_COLUMNS = {metric for spec in REPORTS.values() for metric in spec['metrics']}
+FLOAT_METRICS = {'ga:avgTimeOnPage', 'ga:bounceRate', 'ga:exitRate', 'ga:pageviewsPerSession',
+                 'ga:avgSessionDuration'}
+
+
+def parse_metrics(chunk):
+    """Converts the metric columns of a chunk read as text to fixed number types.
+
+    Thousands separators are stripped and anything unparseable becomes
+    null. Rates and averages are floats, everything else a nullable integer,
+    so a column has the same type in every chunk.
+    """
+    for column in chunk.columns:
+        if column in METRIC_COLUMNS:
+            numbers = pd.to_numeric(chunk[column].str.replace(',', ''), errors='coerce')
+            chunk[column] = numbers if column in FLOAT_METRICS else numbers.round().astype('Int64')
+    return chunk
+
 
-# Read the CSV file into a DataFrame
-df = pd.read_csv(input_csv)
+def convert(input_csv, output_path, ndjson=False, compress=False, chunksize=CHUNK_SIZE):
+    """Streams a CSV to JSON chunk by chunk, so memory doesn't grow with the file.
 
-# Convert the DataFrame to a dictionary
-data = df.to_dict(orient='records')
+    Metric columns are written as JSON numbers (see parse_metrics), every
+    other column as a string, and empty cells as null.
+    """
+    opener = gzip.open if compress else open
+    with opener(output_path, 'wt', encoding='utf-8') as file:
+        if not ndjson:
+            file.write('[\n')
+        first = True
+        for chunk in pd.read_csv(input_csv, chunksize=chunksize, dtype=str):
+            chunk = parse_metrics(chunk)
+            lines = chunk.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n')
+            # pandas escapes every '/', which is legal JSON but bloats page paths
+            lines = lines.replace('\\/', '/')
+            if not lines:
+                continue
+            if ndjson:
+                file.write(lines + '\n')
+            else:
+                # JSON strings can't contain raw newlines, so splitting on them is safe
+                file.write(('' if first else ',\n') + lines.replace('\n', ',\n'))
+            first = False
+        if not ndjson:
+            file.write('\n]\n')
 
-# Save the dictionary to a JSON file
-with open(output_json, 'w') as file:
-    json.dump(data, file, indent=2)
 
-print(f"Converted {input_csv} to {output_json}")
\ No newline at end of file
+if __name__ == '__main__':
+    output_path = output_json.replace('.json', '.ndjson') if NDJSON else output_json
+    if GZIP_OUTPUT:
+        output_path += '.gz'
+    convert(input_csv, output_path, ndjson=NDJSON, compress=GZIP_OUTPUT)
+    print(f"Converted {input_csv} to {output_path}")
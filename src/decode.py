@@ -0,0 +1,96 @@
+import numpy as np
+
+# metricHeaderEntries[].type -> column dtype. TIME is seconds, PERCENT is 0-100.
+METRIC_DTYPES = {
+    'INTEGER': np.int64,
+    'FLOAT': np.float64,
+    'PERCENT': np.float64,
+    'TIME': np.float64,
+    'CURRENCY': np.float64,
+}
+
+
+class DecodedReport:
+    """One report from a batchGet response as typed NumPy columns.
+
+    dimensions maps each dimension name to an object array of strings and
+    metrics maps each metric name to an int64/float64 array chosen from its
+    metricHeaderEntries type, both in the order of columnHeader. When
+    decoded with a DimensionDictionary, dimensions hold int32 IDs into that
+    dictionary instead; values() turns them back into strings.
+    """
+
+    def __init__(self, dimensions, metrics, metric_types, is_golden=True, dictionary=None):
+        self.dimensions = dimensions
+        self.metrics = metrics
+        self.metric_types = metric_types
+        self.is_golden = is_golden
+        self.dictionary = dictionary
+
+    def __len__(self):
+        for column in list(self.dimensions.values()) + list(self.metrics.values()):
+            return len(column)
+        return 0
+
+    @property
+    def columns(self):
+        return list(self.dimensions) + list(self.metrics)
+
+    def column(self, name):
+        return self.dimensions[name] if name in self.dimensions else self.metrics[name]
+
+    def values(self, name, codes=None):
+        """Returns a dimension as strings, looking IDs up in the dictionary if it was interned.
+
+        codes, if given, are IDs (or strings) from this dimension to look up
+        instead of the whole column, e.g. just its unique values.
+        """
+        column = self.dimensions[name] if codes is None else codes
+        return column if self.dictionary is None else self.dictionary.decode(name, column)
+
+    def rows(self, order=None):
+        """Yields plain Python rows (dimensions then metrics), optionally in the given index order."""
+        columns = [self.values(name) if name in self.dimensions else self.metrics[name] for name in self.columns]
+        return zip(*[(column if order is None else column[order]).tolist() for column in columns])
+
+
+def parse_metric_values(values, row_count, metric_count):
+    """Converts a flat list of metric strings into a (rows, metrics) float64 matrix in one pass."""
+    try:
+        matrix = np.array(values, dtype=np.float64)
+    except ValueError:
+        # Thousands separators or other formatting; slow path
+        matrix = np.array([value.replace(',', '') for value in values], dtype=np.float64)
+    return matrix.reshape(row_count, metric_count)
+
+
+def decode_report(report, dictionary=None):
+    columnHeader = report.get('columnHeader', {})
+    dimension_names = columnHeader.get('dimensions', [])
+    entries = columnHeader.get('metricHeader', {}).get('metricHeaderEntries', [])
+    rows = report.get('data', {}).get('rows', [])
+
+    dimension_matrix = np.empty((len(rows), len(dimension_names)), dtype=object)
+    if rows and dimension_names:
+        dimension_matrix[:] = [row['dimensions'] for row in rows]
+    # First date range only, like the CSV writers
+    values = [value for row in rows for value in row['metrics'][0]['values']]
+    metric_matrix = parse_metric_values(values, len(rows), len(entries))
+
+    dimensions = {name: dimension_matrix[:, index] for index, name in enumerate(dimension_names)}
+    if dictionary is not None:
+        # Repeated strings become small integer IDs shared by every report and run
+        dimensions = {name: dictionary.encode(name, column) for name, column in dimensions.items()}
+    metrics = {}
+    metric_types = {}
+    for index, entry in enumerate(entries):
+        metric_types[entry['name']] = entry.get('type', 'INTEGER')
+        dtype = METRIC_DTYPES.get(metric_types[entry['name']], np.float64)
+        metrics[entry['name']] = metric_matrix[:, index].astype(dtype)
+    return DecodedReport(dimensions, metrics, metric_types, report.get('data', {}).get('isDataGolden', True),
+                         dictionary)
+
+
+def decode_response(response, dictionary=None):
+    """Decodes every report in a batchGet response, in order, interning dimensions if given a dictionary."""
+    return [decode_report(report, dictionary) for report in response.get('reports', [])]
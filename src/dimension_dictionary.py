@@ -0,0 +1,93 @@
+import fcntl
+import json
+import os
+import threading
+
+import numpy as np
+
+DICTIONARY_DIR = '../data/dimensions/'
+
+
+class DimensionDictionary:
+    """Persistent value -> integer ID mapping for every dimension, shared across runs.
+
+    Each dimension (say ga:pagePath) has an append-only file
+    <dimension>.jsonl under directory holding one JSON string per line; a
+    value's ID is its line number, so IDs never change once assigned and
+    every report, shard and run using the dimension agrees on them. New
+    values are appended under an exclusive file lock, after picking up any
+    lines another process appended meanwhile, so concurrent exporters can
+    share the directory. A line left half-written by a crash is dropped.
+    """
+
+    def __init__(self, directory=DICTIONARY_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.entries = {}
+
+    def _file_name(self, name):
+        return os.path.join(self.directory, f"{name.replace(':', '_')}.jsonl")
+
+    def _entry(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = {'ids': {}, 'values': [], 'offset': 0}
+            if os.path.exists(self._file_name(name)):
+                with open(self._file_name(name), 'rb') as file:
+                    self._catch_up(entry, file)
+        return entry
+
+    def _catch_up(self, entry, file):
+        file.seek(entry['offset'])
+        data = file.read()
+        # Anything after the last newline is a torn write; it's overwritten by the next append
+        data = data[:data.rfind(b'\n') + 1]
+        for line in data.splitlines():
+            value = json.loads(line)
+            entry['ids'][value] = len(entry['values'])
+            entry['values'].append(value)
+        entry['offset'] += len(data)
+
+    def _add(self, name, entry, values):
+        # O_CREAT without O_TRUNC, so racing to create the file never empties it
+        with os.fdopen(os.open(self._file_name(name), os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                self._catch_up(entry, file)
+                new = [value for value in values if value not in entry['ids']]
+                data = b''.join(json.dumps(value, ensure_ascii=False).encode('utf-8') + b'\n' for value in new)
+                file.seek(entry['offset'])
+                file.write(data)
+                file.truncate()
+                file.flush()
+                os.fsync(file.fileno())
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        for value in new:
+            entry['ids'][value] = len(entry['values'])
+            entry['values'].append(value)
+        entry['offset'] += len(data)
+
+    def encode(self, name, values):
+        """Returns the int32 IDs of values (a sequence of strings), assigning IDs to new ones."""
+        with self.lock:
+            entry = self._entry(name)
+            ids = entry['ids']
+            missing = list(dict.fromkeys(value for value in values if value not in ids))
+            if missing:
+                self._add(name, entry, missing)
+            return np.fromiter((ids[value] for value in values), dtype=np.int32, count=len(values))
+
+    def decode(self, name, codes):
+        """Returns an object array with the value for each ID in codes."""
+        return self.values(name)[np.asarray(codes, dtype=np.int64)]
+
+    def values(self, name):
+        """The lookup table: an object array whose i-th entry is the value with ID i."""
+        with self.lock:
+            entry = self._entry(name)
+            table = entry.get('table')
+            if table is None or len(table) != len(entry['values']):
+                table = entry['table'] = np.array(entry['values'], dtype=object)
+            return table
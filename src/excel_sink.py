@@ -0,0 +1,59 @@
+import logging
+
+import numpy as np
+from openpyxl import Workbook
+
+# Excel's hard limit, including the header row
+MAX_EXCEL_ROWS = 1048576
+
+
+class ExcelSink:
+    """Streams report rows into a single write-only workbook.
+
+    Rows are grouped into one sheet per month (split_by='month') or one per
+    report (split_by='report'); a sheet that reaches MAX_EXCEL_ROWS continues
+    in '<name> (2)', '<name> (3)', ... openpyxl's write-only mode spools each
+    sheet to a temp file, so memory stays flat however long the backfill is.
+    The workbook is only assembled when close() is called at the end of the run.
+    """
+
+    def __init__(self, file_name, split_by='month', sort_column=None):
+        self.file_name = file_name
+        self.split_by = split_by
+        self.sort_column = sort_column
+        self.workbook = Workbook(write_only=True)
+        self.sheets = {}
+
+    def write_reports(self, date, reports, report_name=None):
+        """Appends decoded single-day reports (see decode.py), with a leading date column."""
+        for report in reports:
+            header = ['date'] + report.columns
+            order = None
+            if self.sort_column in report.metrics:
+                order = np.argsort(report.metrics[self.sort_column], kind='stable')[::-1]
+            rows = ([date] + list(row) for row in report.rows(order))
+
+            sheet_name = date[:7] if self.split_by == 'month' else (report_name or 'report')
+            self.append(sheet_name, header, rows)
+
+    def append(self, sheet_name, header, rows):
+        for row in rows:
+            sheet = self._sheet(sheet_name, header)
+            sheet['worksheet'].append(row)
+            sheet['rows'] += 1
+
+    def _sheet(self, sheet_name, header):
+        sheet = self.sheets.get(sheet_name)
+        if sheet is None or sheet['rows'] >= MAX_EXCEL_ROWS:
+            part = 1 if sheet is None else sheet['part'] + 1
+            title = sheet_name if part == 1 else f"{sheet_name} ({part})"
+            worksheet = self.workbook.create_sheet(title=title[:31])
+            worksheet.append(header)
+            sheet = self.sheets[sheet_name] = {'worksheet': worksheet, 'rows': 1, 'part': part}
+        return sheet
+
+    def close(self):
+        if not self.sheets:
+            self.workbook.create_sheet()
+        self.workbook.save(self.file_name)
+        logging.info(f"Saved Excel file: {self.file_name}")
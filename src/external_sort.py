@@ -0,0 +1,109 @@
+import csv
+import heapq
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack
+
+# Rows per in-memory run; a few hundred MB of pandas frame at GA's row widths
+CHUNK_ROWS = 250_000
+CSV_BUFFER_SIZE = 1 << 20
+
+
+def parse_number(text):
+    """'1,234' -> 1234, '12.5' -> 12.5; empty or unparseable text -> None, like errors='coerce'."""
+    text = text.replace(',', '')
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return None
+
+
+def _sort_key(index):
+    # Missing values sort last when descending, as with pandas' na_position='last'
+    def key(row):
+        value = row[index]
+        return float('-inf') if value is None or value != value else value
+    return key
+
+
+def _typed_rows(reader, numeric):
+    for row in reader:
+        yield [parse_number(value) if position in numeric else value for position, value in enumerate(row)]
+
+
+def _write_runs(file_name, sort_column, numeric_columns, chunk_rows, run_dir):
+    """Sorts file_name chunk by chunk, writing each sorted chunk to its own run file."""
+    import pandas as pd
+
+    runs = []
+    for chunk in pd.read_csv(file_name, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        for column in numeric_columns:
+            chunk[column] = pd.to_numeric(chunk[column].str.replace(',', ''), errors='coerce')
+        chunk = chunk.sort_values(by=sort_column, ascending=False, kind='stable')
+        run = os.path.join(run_dir, f"run_{len(runs):05d}.csv")
+        chunk.to_csv(run, index=False, header=False)
+        runs.append(run)
+    logging.info(f"Sorted {file_name} into {len(runs)} runs of up to {chunk_rows} rows")
+    return runs
+
+
+def sorted_csv_rows(file_name, sort_column=None, numeric_columns=(), chunk_rows=CHUNK_ROWS):
+    """Streams a CSV's rows sorted by sort_column, descending, in bounded memory.
+
+    The file is read chunk_rows at a time; each chunk is sorted in memory
+    and spilled to a temporary run file, and the runs are then k-way merged
+    with a heap, so at most one chunk plus one row per run is held at once
+    however large the input is. Numeric columns are converted (thousands
+    separators stripped, unparseable values left empty) and yielded as
+    numbers; without a sort_column the rows stream through in file order.
+
+    Returns:
+      (header, rows): the column names and an iterator of row lists. The
+      run files are removed once rows is exhausted or closed.
+    """
+    with open(file_name, newline='', encoding='utf-8') as file:
+        header = next(csv.reader(file), [])
+    numeric_columns = [column for column in numeric_columns if column in header]
+    numeric = {header.index(column) for column in numeric_columns}
+    if sort_column not in header:
+        return header, _stream(file_name, numeric)
+    return header, _merge(file_name, header, sort_column, numeric_columns, numeric, chunk_rows)
+
+
+def _stream(file_name, numeric):
+    with open(file_name, newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        yield from _typed_rows(reader, numeric)
+
+
+def _merge(file_name, header, sort_column, numeric_columns, numeric, chunk_rows):
+    run_dir = tempfile.mkdtemp(prefix='sort_', dir=os.path.dirname(os.path.abspath(file_name)))
+    try:
+        runs = _write_runs(file_name, sort_column, numeric_columns, chunk_rows, run_dir)
+        with ExitStack() as stack:
+            readers = [_typed_rows(csv.reader(stack.enter_context(
+                open(run, newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE))), numeric) for run in runs]
+            yield from heapq.merge(*readers, key=_sort_key(header.index(sort_column)), reverse=True)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def top_csv_rows(file_name, sort_column, count, numeric_columns=()):
+    """Returns (header, rows) for the count rows with the largest sort_column.
+
+    A single streaming pass keeping a heap of the best count rows, so
+    memory depends on count rather than on the size of the file.
+    """
+    with open(file_name, newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        numeric = {position for position, column in enumerate(header)
+                   if column in numeric_columns or column == sort_column}
+        rows = heapq.nlargest(count, _typed_rows(reader, numeric), key=_sort_key(header.index(sort_column)))
+    return header, rows
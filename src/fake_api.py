@@ -0,0 +1,491 @@
+"""Offline stand-in for the Analytics Reporting API v4 batchGet endpoint.
+
+FakeAnalytics generates deterministic, realistically shaped reports for any
+combination of the dimensions and metrics the exporters use: a Zipf-shaped
+long tail of ga:pagePath values (with query-string variants for the filters
+to strip), category/action/label event trees, per-day volumes with weekly
+seasonality, rowCount/totals, pagination via nextPageToken, isDataGolden for
+recent days and sampling metadata once a range covers too many sessions. It
+can also inject latency and 429/503 errors.
+
+It plugs in three ways:
+  * directly, in place of the service object, since it has the same
+    reports().batchGet(body=...).execute() shape;
+  * as the http of a real discovery client, via FakeAnalytics.http();
+  * as a local server (python fake_api.py --port 8765), which build_client()
+    talks to when UA_FAKE_API is set to its URL.
+"""
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+from batching import MAX_REPORTS_PER_BATCH, batch_key
+from cache import parse_api_date
+from planner import MAX_PAGE_SIZE
+
+BATCH_GET_PATH = '/v4/reports:batchGet'
+DEFAULT_PAGE_SIZE = 1000
+GOLDEN_AFTER_DAYS = 2
+ZIPF_EXPONENT = 1.1
+
+SECTIONS = ['news', 'blog', 'products', 'support', 'about', 'careers', 'events', 'docs', 'community', 'shop']
+CHANNELS = ['Organic Search', 'Direct', 'Referral', 'Social', 'Email', 'Paid Search', 'Display', '(Other)']
+DEVICES = ['desktop', 'mobile', 'tablet']
+BROWSERS = ['Chrome', 'Safari', 'Edge', 'Firefox', 'Samsung Internet', 'Internet Explorer', 'Opera',
+            'Android Webview', 'Safari (in-app)', 'YaBrowser']
+OPERATING_SYSTEMS = ['Windows', 'iOS', 'Android', 'Macintosh', 'Linux', 'Chrome OS', '(not set)', 'Windows Phone']
+COUNTRIES = ['United Kingdom', 'United States', 'India', 'Germany', 'Canada', 'Australia', 'France', 'Ireland',
+             'Netherlands', 'Spain', 'Italy', 'Brazil', 'Nigeria', 'South Africa', 'Japan', 'Poland', 'Sweden',
+             'Pakistan', 'Philippines', 'Mexico', '(not set)']
+EVENT_CATEGORIES = ['Outbound Link', 'Download', 'Video', 'Form', 'Navigation', 'Search', 'Share', 'Scroll Depth',
+                    'Error', 'Newsletter', 'Cart', 'Login']
+EVENT_ACTIONS = ['Click', 'Submit', 'Play', 'Pause', 'Complete', 'View', 'Open', 'Close']
+
+# Metric types as the real API reports them; anything else is an INTEGER count
+METRIC_TYPES = {
+    'ga:bounceRate': 'PERCENT',
+    'ga:exitRate': 'PERCENT',
+    'ga:avgTimeOnPage': 'TIME',
+    'ga:avgSessionDuration': 'TIME',
+    'ga:pageviewsPerSession': 'FLOAT',
+}
+# Counts as a fraction of the row's pageviews
+COUNT_FACTORS = {
+    'ga:pageviews': 1.0,
+    'ga:uniquePageviews': 0.82,
+    'ga:entrances': 0.35,
+    'ga:sessions': 0.4,
+    'ga:users': 0.32,
+    'ga:newUsers': 0.2,
+    'ga:totalEvents': 0.6,
+    'ga:uniqueEvents': 0.45,
+}
+# Per-row (low, high) ranges for the averaged metrics
+RATIO_RANGES = {
+    'ga:bounceRate': (20.0, 80.0),
+    'ga:exitRate': (10.0, 70.0),
+    'ga:avgTimeOnPage': (5.0, 300.0),
+    'ga:avgSessionDuration': (30.0, 600.0),
+    'ga:pageviewsPerSession': (1.5, 4.0),
+}
+
+
+class FakeHttpError(Exception):
+    """Same shape as googleapiclient.errors.HttpError, so is_retryable() treats it the same way."""
+
+    class Response(dict):
+        def __init__(self, status):
+            super().__init__(status=str(status))
+            self.status = status
+            self.reason = ''
+
+    def __init__(self, status, message, reason=None):
+        self.resp = FakeHttpError.Response(status)
+        error = {'code': status, 'message': message, 'status': reason or 'INVALID_ARGUMENT'}
+        self.content = json.dumps({'error': error}).encode('utf-8')
+        super().__init__(f"<HttpError {status}: {message}>")
+
+
+def page_path(index):
+    """The index-th most popular page path; every eleventh is a tracked variant of the one before."""
+    if index % 11 == 10:
+        return page_path(index - 1) + f"?utm_source=newsletter&utm_campaign=c{index % 97}"
+    section = SECTIONS[zlib.crc32(str(index).encode()) % len(SECTIONS)]
+    return '/' if index == 0 else f"/{section}/article-{index}/"
+
+
+def vocabulary(dimension, pages):
+    """Returns (cardinality, value(index, previous_values)) for a dimension."""
+    if dimension == 'ga:pagePath':
+        return pages, lambda index, previous: page_path(index)
+    if dimension == 'ga:eventCategory':
+        return len(EVENT_CATEGORIES), lambda index, previous: EVENT_CATEGORIES[index]
+    if dimension == 'ga:eventAction':
+        # Actions hang off their category, e.g. 'Video Play'
+        def action(index, previous):
+            category = previous.get('ga:eventCategory')
+            return f"{category} {EVENT_ACTIONS[index]}" if category else EVENT_ACTIONS[index]
+        return len(EVENT_ACTIONS), action
+    if dimension == 'ga:eventLabel':
+        def label(index, previous):
+            parent = previous.get('ga:eventAction') or previous.get('ga:eventCategory') or 'event'
+            return '(not set)' if index == 0 else f"{parent.lower().replace(' ', '-')}-{index}"
+        return 40, label
+    fixed = {'ga:channelGrouping': CHANNELS, 'ga:deviceCategory': DEVICES, 'ga:browser': BROWSERS,
+             'ga:operatingSystem': OPERATING_SYSTEMS, 'ga:country': COUNTRIES}.get(dimension)
+    if fixed is None:
+        fixed = [f"{dimension[3:]} {index}" for index in range(25)]
+    return len(fixed), lambda index, previous: fixed[index]
+
+
+def matches(clause_filter, value):
+    operator = clause_filter.get('operator', 'REGEXP')
+    expressions = clause_filter.get('expressions', [''])
+    expression = expressions[0]
+    if operator == 'EXACT':
+        result = value == expression
+    elif operator == 'BEGINS_WITH':
+        result = value.startswith(expression)
+    elif operator == 'ENDS_WITH':
+        result = value.endswith(expression)
+    elif operator == 'PARTIAL':
+        result = expression in value
+    elif operator == 'IN_LIST':
+        result = value in expressions
+    else:
+        result = re.search(expression, value) is not None
+    return result != bool(clause_filter.get('not', False))
+
+
+def passes(clauses, row):
+    """Applies dimensionFilterClauses (AND across clauses, each clause's own OR/AND) to a row dict."""
+    for clause in clauses:
+        results = [matches(f, row[f['dimensionName']]) for f in clause.get('filters', [])
+                   if f['dimensionName'] in row]
+        if results and not (all(results) if clause.get('operator') == 'AND' else any(results)):
+            return False
+    return True
+
+
+class FakeAnalytics:
+    """Deterministic fake of the analyticsreporting v4 service.
+
+    Every value is derived from (seed, report dimensions, day), so the same
+    request always returns the same response, a day's rows are the same
+    whether it is fetched alone or folded into a wider ga:date request, and
+    wider ranges aggregate their days. Only the first dateRange of each
+    request is used.
+
+    Args:
+      seed: Seed for every generated value.
+      pages: Number of distinct ga:pagePath values.
+      daily_rows: Typical number of rows a report has on one day.
+      daily_sessions: Typical property sessions per day; sets volumes and sampling.
+      sample_sessions: Ranges with more sessions than this come back sampled.
+      error_rate: Fraction of batchGet calls that fail with a retryable error.
+      latency: Seconds each call takes, plus up to jitter seconds more.
+      today: Date relative dateRanges and isDataGolden are computed from.
+    """
+
+    def __init__(self, seed=0, pages=20000, daily_rows=5000, daily_sessions=20000, sample_sessions=500000,
+                 error_rate=0.0, latency=0.0, jitter=0.0, today=None):
+        self.seed = seed
+        self.pages = pages
+        self.daily_rows = daily_rows
+        self.daily_sessions = daily_sessions
+        self.sample_sessions = sample_sessions
+        self.error_rate = error_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.today = today or date.today()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        # The last report's rows, so paging through it doesn't regenerate them for every page
+        self._last_rows = (None, None)
+
+    # Service object shape
+
+    def reports(self):
+        return self
+
+    def batchGet(self, body):
+        return FakeRequest(self, body)
+
+    # Data generation
+
+    def _day_factor(self, day):
+        weekly = 0.6 if day.weekday() >= 5 else 1.0
+        growth = 1.0 + (day.toordinal() - date(2017, 1, 1).toordinal()) / 3650
+        return weekly * growth
+
+    def sessions(self, start, end):
+        """Property sessions between start and end, which decides whether a range is sampled."""
+        days = (end - start).days + 1
+        return int(sum(self.daily_sessions * self._day_factor(start + timedelta(days=offset))
+                       for offset in range(days)))
+
+    def _day(self, dimensions, metrics, day):
+        """Returns (row indices, {metric: values}, volume) for one day of a report."""
+        cardinality = 1
+        for dimension in dimensions:
+            cardinality *= vocabulary(dimension, self.pages)[0]
+        key = zlib.crc32('|'.join(dimensions).encode())
+        rng = np.random.default_rng([self.seed, key, day.toordinal()])
+        factor = self._day_factor(day)
+        rows = min(cardinality, max(1, int(self.daily_rows * factor * rng.uniform(0.9, 1.1))))
+        indices = np.arange(rows)
+        weights = 1.0 / (indices + 1.0) ** ZIPF_EXPONENT
+        volume = self.daily_sessions * 2.5 * factor * weights / weights.sum()
+        volume = np.maximum(1.0, volume * rng.lognormal(0.0, 0.3, rows))
+        values = {}
+        for metric in metrics:
+            if metric in RATIO_RANGES:
+                low, high = RATIO_RANGES[metric]
+                values[metric] = rng.uniform(low, high, rows)
+            else:
+                counts = volume * COUNT_FACTORS.get(metric, 1.0) * rng.uniform(0.9, 1.1, rows)
+                values[metric] = np.maximum(1, np.rint(counts)).astype(np.int64)
+        return indices, values, volume
+
+    def _decode(self, dimensions, index):
+        """Maps a row index to its dimension values.
+
+        A single dimension's index-th row is simply its index-th value. With
+        several dimensions each value is drawn log-uniformly (so popular values
+        dominate) from a hash of the index, which can repeat an earlier row's
+        combination; _rows drops those repeats.
+        """
+        radices = [vocabulary(dimension, self.pages) for dimension in dimensions]
+        row = {}
+        for dimension, (cardinality, value) in zip(dimensions, radices):
+            if len(dimensions) == 1:
+                digit = index
+            else:
+                u = zlib.crc32(f"{self.seed}:{dimension}:{index}".encode()) / 2 ** 32
+                digit = min(cardinality - 1, int(cardinality ** u) - 1)
+            row[dimension] = value(digit, row)
+        return row
+
+    def _rows(self, request, start, end):
+        """All rows of a request over start..end as (dimension values, metric values) lists."""
+        dimensions = [entry['name'] for entry in request.get('dimensions', [])]
+        metrics = [entry['expression'] for entry in request.get('metrics', [])]
+        keyed = [dimension for dimension in dimensions if dimension != 'ga:date']
+        clauses = request.get('dimensionFilterClauses', [])
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        # Row indices are a prefix on every day, so an index is always decoded after all smaller ones
+        decoded, seen = {}, set()
+
+        def dimension_values(index, day):
+            if index not in decoded:
+                row = self._decode(keyed, index)
+                key = tuple(row.values())
+                decoded[index] = row if key not in seen and passes(clauses, row) else None
+                seen.add(key)
+            if decoded[index] is None:
+                return None
+            return dict(decoded[index], **{'ga:date': day.strftime('%Y%m%d')})
+
+        def format_row(row, totals):
+            return ([row[dimension] for dimension in dimensions],
+                    [format_metric(metric, totals[metric]) for metric in metrics])
+
+        rows = []
+        if 'ga:date' in dimensions:
+            for day in days:
+                indices, values, _ = self._day(keyed, metrics, day)
+                for position, index in enumerate(indices.tolist()):
+                    row = dimension_values(index, day)
+                    if row is not None:
+                        rows.append(format_row(row, {metric: values[metric][position] for metric in metrics}))
+            return rows
+
+        # Sum counts across days and volume-weight the averaged metrics
+        width = 0
+        sums, weights = {}, None
+        for day in days:
+            indices, values, volume = self._day(keyed, metrics, day)
+            if len(indices) > width:
+                for metric in metrics:
+                    sums[metric] = np.pad(sums.get(metric, np.zeros(0)), (0, len(indices) - width))
+                weights = np.pad(weights if weights is not None else np.zeros(0), (0, len(indices) - width))
+                width = len(indices)
+            for metric in metrics:
+                if metric in RATIO_RANGES:
+                    sums[metric][:len(indices)] += values[metric] * volume
+                else:
+                    sums[metric][:len(indices)] += values[metric]
+            weights[:len(indices)] += volume
+        for index in range(width):
+            row = dimension_values(index, start)
+            if row is not None:
+                totals = {metric: sums[metric][index] / weights[index] if metric in RATIO_RANGES
+                          else int(sums[metric][index]) for metric in metrics}
+                rows.append(format_row(row, totals))
+        return rows
+
+    def report(self, request):
+        """Builds one report (one page of it) for a reportRequest."""
+        date_range = request['dateRanges'][0]
+        start = parse_api_date(date_range['startDate'], self.today)
+        end = parse_api_date(date_range['endDate'], self.today)
+        if end < start:
+            raise FakeHttpError(400, 'The start date must not be after the end date.')
+        page_size = int(request.get('pageSize', DEFAULT_PAGE_SIZE))
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise FakeHttpError(400, f"pageSize must be between 1 and {MAX_PAGE_SIZE}.")
+        offset = int(request.get('pageToken') or 0)
+
+        metrics = [entry['expression'] for entry in request.get('metrics', [])]
+        key = json.dumps({name: value for name, value in request.items() if name not in ('pageToken', 'pageSize')},
+                         sort_keys=True)
+        with self.lock:
+            last_key, rows = self._last_rows
+        if last_key != key:
+            rows = self._rows(request, start, end)
+            with self.lock:
+                self._last_rows = (key, rows)
+        page = rows[offset:offset + page_size]
+        data = {
+            'rows': [{'dimensions': dimensions, 'metrics': [{'values': values}]} for dimensions, values in page],
+            'totals': [{'values': self._totals(metrics, rows)}],
+            'rowCount': len(rows),
+            'isDataGolden': (self.today - end).days > GOLDEN_AFTER_DAYS,
+        }
+        sessions = self.sessions(start, end)
+        if sessions > self.sample_sessions:
+            data['samplesReadCounts'] = [str(self.sample_sessions)]
+            data['samplingSpaceSizes'] = [str(sessions)]
+        report = {
+            'columnHeader': {
+                'dimensions': [entry['name'] for entry in request.get('dimensions', [])],
+                'metricHeader': {'metricHeaderEntries': [{'name': metric, 'type': METRIC_TYPES.get(metric, 'INTEGER')}
+                                                         for metric in metrics]},
+            },
+            'data': data,
+        }
+        if offset + page_size < len(rows):
+            report['nextPageToken'] = str(offset + page_size)
+        return report
+
+    def _totals(self, metrics, rows):
+        totals = []
+        for position, metric in enumerate(metrics):
+            values = [float(row[1][position]) for row in rows]
+            if metric in RATIO_RANGES:
+                totals.append(format_metric(metric, sum(values) / len(values) if values else 0.0))
+            else:
+                totals.append(str(int(sum(values))))
+        return totals
+
+    def batch_get(self, body):
+        """Handles one batchGet body the way the real endpoint does, raising FakeHttpError on failure."""
+        with self.lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+                # Mostly rate limiting, with the odd backend failure
+                status = 429 if self.random.random() < 0.8 else 503
+        if delay:
+            time.sleep(delay)
+        if fail and status == 429:
+            raise FakeHttpError(429, 'Quota exceeded for quota metric', 'RESOURCE_EXHAUSTED')
+        if fail:
+            raise FakeHttpError(503, 'The service is currently unavailable.', 'UNAVAILABLE')
+
+        requests = body.get('reportRequests', [])
+        if not requests or len(requests) > MAX_REPORTS_PER_BATCH:
+            raise FakeHttpError(400, f"A batchGet must contain between 1 and {MAX_REPORTS_PER_BATCH} reportRequests.")
+        if len({batch_key(request) for request in requests}) > 1:
+            raise FakeHttpError(400, 'All reportRequests must have the same viewId, dateRanges, samplingLevel, '
+                                     'segments and cohortGroup.')
+        return {'reports': [self.report(request) for request in requests]}
+
+    def stats(self):
+        return f"{self.calls} fake batchGet calls, {self.errors} injected errors"
+
+    # Transports
+
+    def http(self):
+        """An httplib2.Http stand-in that serves this fake to a discovery-built client."""
+        return FakeHttp(self)
+
+    def serve(self, host='127.0.0.1', port=8765):
+        """Serves batchGet on http://host:port/ until interrupted."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                status, content = api.handle(urlparse(self.path).path, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                logging.debug(format % args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        logging.info(f"Fake Analytics Reporting API listening on http://{host}:{port}/")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def handle(self, path, content):
+        """Handles a raw HTTP request body, returning (status, response bytes)."""
+        if not path.endswith(BATCH_GET_PATH):
+            return 404, json.dumps({'error': {'code': 404, 'message': f"No such method {path}"}}).encode('utf-8')
+        try:
+            response = self.batch_get(json.loads(content or b'{}'))
+        except FakeHttpError as error:
+            return error.resp.status, error.content
+        return 200, json.dumps(response).encode('utf-8')
+
+
+def format_metric(metric, value):
+    if metric in RATIO_RANGES:
+        return repr(round(float(value), 6))
+    return str(int(value))
+
+
+class FakeRequest:
+    def __init__(self, api, body):
+        self.api = api
+        self.body = body
+
+    def execute(self):
+        return self.api.batch_get(self.body)
+
+
+class FakeHttp:
+    """Minimal httplib2.Http replacement answering batchGet from a FakeAnalytics."""
+
+    def __init__(self, api):
+        self.api = api
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        import httplib2
+        status, content = self.api.handle(urlparse(uri).path, body)
+        return httplib2.Response({'status': status, 'content-type': 'application/json; charset=UTF-8'}), content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Analytics Reporting API v4 locally.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pages', type=int, default=20000, help="Distinct ga:pagePath values")
+    parser.add_argument('--daily-rows', type=int, default=5000, help="Typical rows per report per day")
+    parser.add_argument('--daily-sessions', type=int, default=20000)
+    parser.add_argument('--sample-sessions', type=int, default=500000,
+                        help="Ranges with more sessions than this are sampled")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls failing with 429/503")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every call")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many more seconds per call")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    FakeAnalytics(seed=args.seed, pages=args.pages, daily_rows=args.daily_rows, daily_sessions=args.daily_sessions,
+                  sample_sessions=args.sample_sessions, error_rate=args.error_rate, latency=args.latency,
+                  jitter=args.jitter).serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 4
+
+
+def fetch_shards(client_factory, fetch, shards, workers=DEFAULT_WORKERS):
+    """Fetches date shards on a bounded worker pool and yields them in order.
+
+    Each worker thread builds its own client with client_factory() the first
+    time it runs and reuses it for every later shard, since the httplib2
+    transport behind a discovery service object is not thread-safe.
+
+    Args:
+      client_factory: Callable returning an authorized analyticsreporting
+        service object (or a fake with the same reports().batchGet() shape).
+      fetch: Callable taking (client, shard) and returning the shard's result.
+      shards: Iterable of shards, e.g. 'YYYY-MM-DD' date strings.
+      workers: Maximum number of requests in flight.
+    Yields:
+      (shard, result) tuples in the same order as shards.
+    """
+    local = threading.local()
+
+    def run(shard):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = client_factory()
+        logging.info(f"Fetching data for shard: {shard}")
+        return fetch(client, shard)
+
+    # Keep a small window of submitted shards so memory stays bounded even
+    # when the caller is slower than the API.
+    window = max(1, workers) * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        try:
+            for shard in shards:
+                pending.append((shard, pool.submit(run, shard)))
+                if len(pending) >= window:
+                    shard, future = pending.popleft()
+                    yield shard, future.result()
+            while pending:
+                shard, future = pending.popleft()
+                yield shard, future.result()
+        finally:
+            # Don't start shards nobody will consume if the caller bails out.
+            for _, future in pending:
+                future.cancel()
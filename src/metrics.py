@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from checkpoint import atomic_write_json
+
+METRICS_DIR = '../data/metrics/'
+# Seconds; wide enough for both a sub-millisecond decode and a slow paginated batchGet
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+WRITE_INTERVAL = 30
+
+
+def response_rows(response):
+    """Number of rows across every report in a batchGet response."""
+    return sum(len(report.get('data', {}).get('rows', [])) for report in response.get('reports', []))
+
+
+def file_size(file_name):
+    try:
+        return os.path.getsize(file_name)
+    except OSError:
+        return 0
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-th quantile (the largest bound if it overflows)."""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class StageSample:
+    """What a timed block handled; set rows and bytes before the block ends."""
+
+    def __init__(self, rows=0, bytes=0):
+        self.rows = rows
+        self.bytes = bytes
+
+
+class RunMetrics:
+    """Per-stage latency, throughput and progress for one export run.
+
+    Stages are timed with timer(), which records a latency histogram and the
+    rows and bytes each stage handled. Progress against the run's total
+    (days, usually) drives the ETA. write() exports everything as a
+    Prometheus textfile (metrics_dir/<job>.prom, for node_exporter's
+    textfile collector) and a JSON summary (metrics_dir/<job>.json); both are
+    rewritten every WRITE_INTERVAL seconds while the run progresses, so a
+    stalled or slow backfill shows up before it finishes.
+    """
+
+    def __init__(self, job, metrics_dir=METRICS_DIR, total=None, cache=None, scheduler=None):
+        self.job = job
+        self.metrics_dir = metrics_dir
+        self.total = total
+        self.cache = cache
+        self.scheduler = scheduler
+        self.started = time.time()
+        self.done = 0
+        self.status = 'running'
+        self.histograms = {}
+        self.rows = {}
+        self.bytes = {}
+        self.lock = threading.Lock()
+        self.last_write = 0.0
+
+    def observe(self, stage, seconds, rows=0, bytes=0):
+        with self.lock:
+            self.histograms.setdefault(stage, Histogram()).observe(seconds)
+            self.rows[stage] = self.rows.get(stage, 0) + rows
+            self.bytes[stage] = self.bytes.get(stage, 0) + bytes
+
+    @contextmanager
+    def timer(self, stage, rows=0, bytes=0):
+        """Times the block as one call of stage; the yielded sample's rows/bytes are recorded with it."""
+        sample = StageSample(rows, bytes)
+        start = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            self.observe(stage, time.perf_counter() - start, sample.rows, sample.bytes)
+
+    def progress(self, units=1):
+        """Marks units of the run's total as done and periodically rewrites the exports."""
+        with self.lock:
+            self.done += units
+        if time.time() - self.last_write >= WRITE_INTERVAL:
+            self.write()
+
+    def eta(self):
+        """Seconds left at the average rate so far, or None if unknown."""
+        if not self.total or not self.done:
+            return None
+        elapsed = time.time() - self.started
+        return max(0.0, elapsed / self.done * (self.total - self.done))
+
+    def summary(self):
+        with self.lock:
+            elapsed = time.time() - self.started
+            stages = {}
+            for stage, histogram in self.histograms.items():
+                stages[stage] = {
+                    'calls': histogram.count,
+                    'seconds': round(histogram.sum, 3),
+                    'mean_seconds': round(histogram.sum / histogram.count, 4) if histogram.count else None,
+                    'p50_seconds': histogram.quantile(0.5),
+                    'p95_seconds': histogram.quantile(0.95),
+                    'rows': self.rows.get(stage, 0),
+                    'bytes': self.bytes.get(stage, 0),
+                    'rows_per_sec': round(self.rows.get(stage, 0) / histogram.sum, 1) if histogram.sum else None,
+                }
+            summary = {
+                'job': self.job,
+                'status': self.status,
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'elapsed_seconds': round(elapsed, 1),
+                'done': self.done,
+                'total': self.total,
+                'stages': stages,
+            }
+        eta = self.eta()
+        summary['eta_seconds'] = round(eta, 1) if eta is not None else None
+        # The stage with the most wall time is where the run is bottlenecked
+        summary['slowest_stage'] = max(stages, key=lambda stage: stages[stage]['seconds'], default=None)
+        if self.cache:
+            summary['cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses,
+                                'evictions': self.cache.evictions}
+        if self.scheduler:
+            summary['api'] = {'retries': self.scheduler.retries, 'quota_used_today': self.scheduler.used['project']}
+        return summary
+
+    def prometheus(self, summary):
+        """Renders the summary in the Prometheus text exposition format."""
+        job = f'job="{self.job}"'
+        lines = [
+            '# HELP ua_export_stage_seconds Time spent per call of each export stage.',
+            '# TYPE ua_export_stage_seconds histogram',
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                labels = f'{job},stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'ua_export_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'ua_export_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'ua_export_stage_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'ua_export_stage_seconds_count{{{labels}}} {histogram.count}')
+            lines.append('# HELP ua_export_rows_total Rows processed per stage.')
+            lines.append('# TYPE ua_export_rows_total counter')
+            lines += [f'ua_export_rows_total{{{job},stage="{stage}"}} {rows}'
+                      for stage, rows in sorted(self.rows.items())]
+            lines.append('# HELP ua_export_bytes_total Bytes written or read per stage.')
+            lines.append('# TYPE ua_export_bytes_total counter')
+            lines += [f'ua_export_bytes_total{{{job},stage="{stage}"}} {size}'
+                      for stage, size in sorted(self.bytes.items())]
+
+        gauges = [
+            ('ua_export_done', 'Units (days) of the run completed.', summary['done']),
+            ('ua_export_total', 'Units (days) the run covers.', summary['total']),
+            ('ua_export_eta_seconds', 'Estimated seconds until the run finishes.', summary['eta_seconds']),
+            ('ua_export_elapsed_seconds', 'Seconds since the run started.', summary['elapsed_seconds']),
+            ('ua_export_running', '1 while the run is in progress.', int(summary['status'] == 'running')),
+            ('ua_export_last_update_timestamp_seconds', 'When these metrics were written.', round(time.time())),
+        ]
+        if 'cache' in summary:
+            gauges += [('ua_export_cache_hits', 'Response cache hits this run.', summary['cache']['hits']),
+                       ('ua_export_cache_misses', 'Response cache misses this run.', summary['cache']['misses'])]
+        if 'api' in summary:
+            gauges += [('ua_export_api_retries', 'batchGet retries this run.', summary['api']['retries']),
+                       ('ua_export_quota_used', 'Reporting API requests used today.',
+                        summary['api']['quota_used_today'])]
+        for name, help_text, value in gauges:
+            if value is None:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name}{{{job}}} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """Atomically rewrites the Prometheus textfile and the JSON summary."""
+        self.last_write = time.time()
+        summary = self.summary()
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        atomic_write_json(summary, os.path.join(self.metrics_dir, f"{self.job}.json"), indent=2)
+        prom_file = os.path.join(self.metrics_dir, f"{self.job}.prom")
+        with open(f"{prom_file}.tmp", 'w', encoding='utf-8') as file:
+            file.write(self.prometheus(summary))
+        os.replace(f"{prom_file}.tmp", prom_file)
+        return summary
+
+    def close(self, status='finished'):
+        self.status = status
+        summary = self.write()
+        logging.info(f"Run metrics: {summary['elapsed_seconds']}s, slowest stage {summary['slowest_stage']}, "
+                     f"written to {self.metrics_dir}")
+        return summary
@@ -0,0 +1,115 @@
+import logging
+import queue
+import threading
+
+QUEUE_SIZE = 8
+# How often a blocked put/get wakes up to check whether the pipeline was stopped
+POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+class Pipeline:
+    """A source and a chain of stages, each in its own thread, joined by bounded queues.
+
+    Items flow from the source iterator through every stage in order; a
+    stage is a callable taking an item and returning the item for the next
+    stage (None drops it). Each stage sees items in source order, and since
+    every queue holds at most maxsize items, a slow stage (say, writing the
+    workbook) backs up into the ones before it instead of letting fetched
+    responses pile up in memory, while faster stages keep working. run()
+    yields what the last stage returns; the first exception raised by the
+    source or any stage stops the whole pipeline and is re-raised there.
+    """
+
+    def __init__(self, source, maxsize=QUEUE_SIZE):
+        self.source = source
+        self.maxsize = maxsize
+        self.stages = []
+        self.stopped = threading.Event()
+        self.error = None
+
+    def stage(self, name, func):
+        self.stages.append((name, func))
+        return self
+
+    def _put(self, output, item):
+        while not self.stopped.is_set():
+            try:
+                output.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+        raise PipelineStopped()
+
+    def _get(self, input):
+        while not self.stopped.is_set():
+            try:
+                return input.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        raise PipelineStopped()
+
+    def _fail(self, name, error):
+        if not self.stopped.is_set():
+            logging.error(f"Pipeline stage {name} failed: {error}")
+            self.error = error
+            self.stopped.set()
+
+    def _produce(self, output):
+        try:
+            for item in self.source:
+                self._put(output, item)
+            self._put(output, _DONE)
+        except PipelineStopped:
+            pass
+        except Exception as error:
+            self._fail('source', error)
+        finally:
+            # Let a generator source (e.g. fetch_shards) cancel its in-flight work
+            close = getattr(self.source, 'close', None)
+            if close:
+                close()
+
+    def _work(self, name, func, input, output):
+        try:
+            while True:
+                item = self._get(input)
+                if item is _DONE:
+                    self._put(output, _DONE)
+                    return
+                result = func(item)
+                if result is not None:
+                    self._put(output, result)
+        except PipelineStopped:
+            pass
+        except Exception as error:
+            self._fail(name, error)
+
+    def run(self):
+        queues = [queue.Queue(self.maxsize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._produce, args=(queues[0],), name='pipeline-source', daemon=True)]
+        for position, (name, func) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._work, args=(name, func, queues[position], queues[position + 1]),
+                                            name=f"pipeline-{name}", daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                try:
+                    item = self._get(queues[-1])
+                except PipelineStopped:
+                    break
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,68 @@
+import logging
+from datetime import timedelta
+
+# Largest pageSize the Reporting API v4 accepts
+MAX_PAGE_SIZE = 100000
+
+
+def is_sampled(response):
+    """True if any report in the response was computed from a sample."""
+    return any('samplesReadCounts' in report.get('data', {}) or 'samplingSpaceSizes' in report.get('data', {})
+               for report in response.get('reports', []))
+
+
+def is_golden(response):
+    return all(report.get('data', {}).get('isDataGolden', False) for report in response.get('reports', []))
+
+
+def row_count(response):
+    return max((report.get('data', {}).get('rowCount', 0) for report in response.get('reports', [])), default=0)
+
+
+class ShardPlanner:
+    """Picks date shards that are as wide as possible while staying unsampled.
+
+    probe(start, end) must return the first page of the report for that
+    range (it goes through the response cache, so the export's own first
+    request for an accepted shard is free). A sampled shard is halved and
+    re-probed until it is unsampled or min_days wide; after an unsampled
+    shard whose rowCount would still fit twice into target_rows, the next
+    shard is twice as wide, up to max_days and never as wide as a range
+    that has already come back sampled.
+    """
+
+    def __init__(self, probe, initial_days=7, min_days=1, max_days=366, target_rows=MAX_PAGE_SIZE):
+        self.probe = probe
+        self.initial_days = initial_days
+        self.min_days = min_days
+        self.max_days = max_days
+        self.target_rows = target_rows
+        self.calls = 0
+
+    def plan(self, start_date, end_date):
+        """Yields (start, end) datetimes covering start_date..end_date inclusive."""
+        width = self.initial_days
+        # Widest range known to be unsampled-able; widening never goes past it
+        limit = self.max_days
+        current = start_date
+        while current <= end_date:
+            end = min(current + timedelta(days=width - 1), end_date)
+            days = (end - current).days + 1
+            response = self.probe(current.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+            self.calls += 1
+            sampled = is_sampled(response)
+
+            if sampled and days > self.min_days:
+                width = max(self.min_days, days // 2)
+                limit = min(limit, days - 1)
+                logging.info(f"Sampled {current:%Y-%m-%d} to {end:%Y-%m-%d}, splitting to {width} days")
+                continue
+            if sampled:
+                logging.warning(f"{current:%Y-%m-%d} to {end:%Y-%m-%d} is still sampled at {days} days")
+
+            yield current, end
+            current = end + timedelta(days=1)
+            if not sampled and row_count(response) * 2 <= self.target_rows:
+                width = min(limit, days * 2)
+            else:
+                width = days
@@ -0,0 +1,130 @@
+"""Declarative definitions of every report the exporters pull.
+
+Each spec names the report's metrics, dimensions and filters, how wide its
+date shards are, where its output goes and which sinks it feeds. The
+individual scripts build their request bodies from these, and runner.py can
+execute any set of them in a single process.
+"""
+from planner import MAX_PAGE_SIZE
+
+VIEW_ID = '150538750'
+
+# Query-string variants of a page are noise for every page report
+NO_QUERY_STRING_FILTER = [
+    {
+        "filters": [
+            {
+                "dimensionName": "ga:pagePath",
+                "operator": "REGEXP",
+                "not": True,
+                "expressions": ["\\?.*"]
+            }
+        ]
+    }
+]
+
+PAGE_METRICS = ['ga:pageviews', 'ga:uniquePageviews', 'ga:avgTimeOnPage', 'ga:entrances', 'ga:bounceRate',
+                'ga:exitRate']
+TRAFFIC_METRICS = ['ga:users', 'ga:newUsers', 'ga:sessions', 'ga:bounceRate', 'ga:pageviewsPerSession',
+                   'ga:avgSessionDuration']
+EVENT_DIMENSIONS = ['ga:pagePath', 'ga:eventCategory', 'ga:eventAction', 'ga:eventLabel']
+
+REPORTS = {
+    'all_pages': {
+        'metrics': PAGE_METRICS,
+        'dimensions': ['ga:pagePath'],
+        'filters': NO_QUERY_STRING_FILTER,
+        'shard_days': 1,
+        'output_dir': '../data/all_pages/',
+        'file_prefix': 'UniversalAnalytics_AllPages',
+        'sort_column': 'ga:pageviews',
+        'sinks': ['csv', 'archive', 'excel', 'columnar', 'sqlite'],
+    },
+    'all_events': {
+        'metrics': ['ga:totalEvents', 'ga:uniqueEvents'],
+        'dimensions': ['ga:eventCategory'],
+        'shard_days': 1,
+        'output_dir': '../data/all_events/',
+        'file_prefix': 'UniversalAnalytics_AllEvents',
+        'sort_column': 'ga:totalEvents',
+        'sinks': ['csv', 'archive', 'excel', 'columnar', 'sqlite'],
+    },
+    'all_traffic': {
+        'metrics': TRAFFIC_METRICS,
+        'dimensions': ['ga:channelGrouping'],
+        'shard_days': 1,
+        'output_dir': '../data/all_traffic/',
+        'file_prefix': 'UniversalAnalytics_AllTraffic',
+        'sort_column': 'ga:sessions',
+        'sinks': ['csv', 'archive', 'excel', 'columnar', 'sqlite'],
+    },
+    'all_devices': {
+        'metrics': TRAFFIC_METRICS,
+        'dimensions': ['ga:channelGrouping', 'ga:deviceCategory', 'ga:browser', 'ga:operatingSystem'],
+        'shard_days': 1,
+        'output_dir': '../data/all_devices/',
+        'file_prefix': 'UniversalAnalytics_AllDevices',
+        'sort_column': 'ga:sessions',
+        'sinks': ['csv', 'archive', 'columnar'],
+    },
+    'pages_weekly': {
+        'metrics': PAGE_METRICS,
+        'dimensions': ['ga:pagePath'],
+        'filters': NO_QUERY_STRING_FILTER,
+        'page_size': MAX_PAGE_SIZE,
+        'shard_days': 7,
+        'output_dir': '../data/all_pages/',
+        # Not all_pages' prefix: runner.py refuses specs sharing an output file
+        'file_prefix': 'UniversalAnalytics_AllPages_Weekly',
+        'sort_column': 'ga:pageviews',
+        'sinks': ['csv', 'archive'],
+    },
+    'events_weekly': {
+        'metrics': ['ga:totalEvents'],
+        'dimensions': EVENT_DIMENSIONS,
+        'page_size': MAX_PAGE_SIZE,
+        'shard_days': 7,
+        'output_dir': '../data/all_pages/',
+        'file_prefix': 'UniversalAnalytics_AllPages_Events_Weekly',
+        'sort_column': 'ga:totalEvents',
+        'sinks': ['csv', 'archive'],
+    },
+    'ua_pages': {
+        'metrics': PAGE_METRICS,
+        'dimensions': ['ga:pagePath'],
+        'filters': NO_QUERY_STRING_FILTER,
+        'date_range': ('2014-11-01', '400daysAgo'),
+        'output_dir': './',
+        'file_prefix': 'UniversalAnalytics_AllPages',
+        'sinks': ['csv'],
+    },
+    'ua_browsers': {
+        'metrics': ['ga:pageviews', 'ga:sessions', 'ga:users', 'ga:newUsers', 'ga:bounceRate',
+                    'ga:avgSessionDuration'],
+        'dimensions': ['ga:browser', 'ga:country', 'ga:date'],
+        'date_range': ('2014-11-01', '400daysAgo'),
+        'output_dir': './',
+        'file_prefix': 'UniversalAnalytics_AllPages_Events',
+        'sinks': ['csv'],
+    },
+}
+
+# Sent together in one batchGet by all_pages_events.py and all_pages_events_full.py
+PAGE_EVENT_REPORTS = ('pages_weekly', 'events_weekly')
+NIGHTLY_REPORTS = ('all_pages', 'all_events', 'all_traffic', 'all_devices')
+
+
+def report_request(spec, start_date, end_date, page_token=None):
+    """Builds the reportRequest for a spec over start_date..end_date ('YYYY-MM-DD' or relative)."""
+    request = {
+        "viewId": spec.get('view_id', VIEW_ID),
+        "dateRanges": [{"startDate": start_date, "endDate": end_date}],
+        "metrics": [{"expression": metric} for metric in spec['metrics']],
+        "dimensions": [{"name": dimension} for dimension in spec['dimensions']],
+        "pageSize": spec.get('page_size', 10000)
+    }
+    if spec.get('filters'):
+        request["dimensionFilterClauses"] = spec['filters']
+    if page_token:
+        request["pageToken"] = page_token
+    return request
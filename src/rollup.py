@@ -0,0 +1,230 @@
+"""Weekly, monthly and all-time aggregates built locally from the daily columnar store.
+
+Sums are exact for additive metrics. Rates and averages can't be summed or
+averaged, so each one is recombined from a numerator and denominator that
+the report's own metrics imply: bounce rate on a page is bounces over
+entrances, so the weekly rate is sum(bounceRate * entrances) / sum(entrances),
+and so on. The same rule applies at every level, which lets the all-time
+figures be built from the monthly ones. Distinct counts such as ga:users
+can't be recovered from daily totals and are left out.
+
+Only the months whose daily partitions changed since the last run are
+re-aggregated (plus the previous month, whose last week may spill over),
+so a nightly run touches one or two months:
+
+    python rollup.py                       # every report in the columnar store
+    python rollup.py all_pages --rebuild   # one report, from scratch
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from checkpoint import atomic_write_json
+from columnar import COLUMNAR_DIR, SCHEMA_FILE, ColumnarWriter, partitions, read_columns
+from decode import DecodedReport
+from report_specs import NIGHTLY_REPORTS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ROLLUP_DIR = '../data/rollups/'
+GRAINS = ('week', 'month', 'all')
+
+
+def _exits(frame):
+    return frame['ga:pageviews'] * frame['ga:exitRate'] / 100
+
+
+# Rates and averages: each one's denominator, from a frame of the report's
+# own metrics. Its numerator is value * denominator.
+WEIGHTS = {
+    # Per page, bounces over sessions starting there; per channel, over all sessions
+    'ga:bounceRate': lambda frame: frame['ga:entrances'] if 'ga:entrances' in frame else frame['ga:sessions'],
+    'ga:exitRate': lambda frame: frame['ga:pageviews'],
+    # Time on page is only measured for pageviews that weren't exits
+    'ga:avgTimeOnPage': lambda frame: frame['ga:pageviews'] - _exits(frame),
+    'ga:avgSessionDuration': lambda frame: frame['ga:sessions'],
+    'ga:pageviewsPerSession': lambda frame: frame['ga:sessions'],
+}
+# Distinct counts whose daily values can't be combined
+NOT_ROLLABLE = {'ga:users'}
+
+
+def rollable_metrics(schema):
+    """Returns metric name -> type for the metrics of a columnar schema that can be rolled up."""
+    import pandas as pd
+
+    # A rate is only kept if the report also has the metrics its weight comes from
+    available = pd.DataFrame(columns=[metric['name'] for metric in schema['metrics']], dtype=np.float64)
+    metrics = {}
+    for metric in schema['metrics']:
+        if metric['name'] in NOT_ROLLABLE:
+            continue
+        if metric['name'] in WEIGHTS:
+            try:
+                WEIGHTS[metric['name']](available)
+            except KeyError:
+                continue
+        metrics[metric['name']] = metric['type']
+    return metrics
+
+
+def read_schema(report_name, root=COLUMNAR_DIR):
+    for partition in partitions(root, report_name):
+        with open(os.path.join(partition, SCHEMA_FILE), encoding='utf-8') as file:
+            return json.load(file)
+    return None
+
+
+def shift_month(month, months):
+    year, number = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + months, 12)
+    return f"{year:04d}-{number + 1:02d}"
+
+
+def aggregate(frame, keys, dimensions, metrics):
+    """Sums frame over keys + dimensions, recombining rates and averages with their weights.
+
+    Args:
+      frame: Rows with the keys, dimensions and metrics columns.
+      keys: Extra grouping columns, e.g. the period start.
+      dimensions: The report's dimension names.
+      metrics: Dict of metric name -> metricHeaderEntries type, in output order.
+    Returns:
+      A DataFrame with keys, dimensions and metrics, metrics keeping their dtypes.
+    """
+    frame = frame[keys + dimensions + list(metrics)].copy()
+    # Every weight from the metrics as given, before any of them is turned into a numerator
+    weights = {name: WEIGHTS[name](frame).astype(np.float64) for name in metrics if name in WEIGHTS}
+    for name, weight in weights.items():
+        frame[name] = frame[name] * weight
+        frame[f"{name}:weight"] = weight
+    sums = frame.groupby(keys + dimensions, observed=True, sort=False).sum(numeric_only=True).reset_index()
+    for name in metrics:
+        if name in WEIGHTS:
+            weight = sums.pop(f"{name}:weight").to_numpy()
+            # GA reports 0 rather than NaN when there's nothing to average over
+            sums[name] = np.divide(sums[name].to_numpy(), weight, out=np.zeros(len(sums)), where=weight > 0)
+    return sums[keys + dimensions + list(metrics)]
+
+
+class Rollup:
+    """Maintains the week/month/all rollups of one report in the columnar format.
+
+    Each grain is stored as its own report under root, '<report>_week',
+    '<report>_month' and '<report>_all', with the period's first day as the
+    date, so read_columns() and friends work on them unchanged. Which daily
+    partitions have been rolled up is tracked in '<report>.json' by
+    modification time and size; ColumnarWriter replaces a partition as a
+    whole, so a rewritten month always shows up as changed.
+    """
+
+    def __init__(self, report_name, source=COLUMNAR_DIR, root=ROLLUP_DIR):
+        self.report_name = report_name
+        self.source = source
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.state_file = os.path.join(root, f"{report_name}.json")
+
+    def signatures(self):
+        result = {}
+        for partition in partitions(self.source, self.report_name):
+            stat = os.stat(os.path.join(partition, 'date.npy'))
+            result[os.path.basename(partition)[len('month='):]] = [stat.st_mtime_ns, stat.st_size]
+        return result
+
+    def load_state(self):
+        try:
+            with open(self.state_file, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def rebuild(self):
+        for grain in GRAINS:
+            shutil.rmtree(os.path.join(self.root, f"{self.report_name}_{grain}"), ignore_errors=True)
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+    def update(self):
+        """Re-aggregates the months that changed since the last run; returns how many did."""
+        schema = read_schema(self.report_name, self.source)
+        if schema is None:
+            logging.info(f"No daily data for {self.report_name} yet")
+            return 0
+        dimensions = schema['dimensions']
+        metrics = rollable_metrics(schema)
+        for metric in schema['metrics']:
+            if metric['name'] not in metrics:
+                logging.warning(f"Leaving {metric['name']} out of the {self.report_name} rollups")
+
+        signatures = self.signatures()
+        state = self.load_state()
+        changed = sorted(month for month, signature in signatures.items() if state.get(month) != signature)
+        if not changed:
+            logging.info(f"{self.report_name} rollups are up to date")
+            return 0
+
+        weeks = ColumnarWriter(self.root, f"{self.report_name}_week")
+        months = ColumnarWriter(self.root, f"{self.report_name}_month")
+        # A month's first days can belong to a week starting the month before, so
+        # that month's weeks are redone too, even when it has no daily partition
+        for month in sorted(set(changed) | {shift_month(month, -1) for month in changed}):
+            # Weeks starting this month need up to six days of the next one
+            frame = read_columns(self.source, self.report_name, start_month=month, end_month=shift_month(month, 1))
+            days = frame['date'].to_numpy().astype('datetime64[D]')
+            # ISO weeks, Monday first, like the 7-day shards from 2017-05-15; 1970-01-01 was a Thursday
+            week_start = days - ((days.view('int64') + 3) % 7).astype('timedelta64[D]')
+            frame = frame[dimensions + list(metrics)]
+            in_month = week_start.astype('datetime64[M]') == np.datetime64(month, 'M')
+            self._write(weeks, aggregate(frame[in_month].assign(period=week_start[in_month]), ['period'],
+                                         dimensions, metrics), dimensions, metrics)
+            if month in changed:
+                in_month = days.astype('datetime64[M]') == np.datetime64(month, 'M')
+                self._write(months, aggregate(frame[in_month].assign(period=np.datetime64(f"{month}-01")), ['period'],
+                                              dimensions, metrics), dimensions, metrics)
+            logging.info(f"Rolled up {self.report_name} for {month}")
+        weeks.close()
+        months.close()
+
+        # All-time from the monthly rollups, which is exact for every metric kept
+        monthly = read_columns(self.root, f"{self.report_name}_month")
+        monthly = monthly[dimensions + list(metrics)].assign(period=monthly['date'].min())
+        shutil.rmtree(os.path.join(self.root, f"{self.report_name}_all"), ignore_errors=True)
+        everything = ColumnarWriter(self.root, f"{self.report_name}_all")
+        self._write(everything, aggregate(monthly, ['period'], dimensions, metrics), dimensions, metrics)
+        everything.close()
+
+        atomic_write_json(signatures, self.state_file, indent=1)
+        return len(changed)
+
+    @staticmethod
+    def _write(writer, frame, dimensions, metrics):
+        """Feeds aggregated rows to a ColumnarWriter one period at a time, in date order."""
+        for period, rows in frame.groupby('period', sort=True):
+            report = DecodedReport(
+                {name: rows[name].astype(str).to_numpy(dtype=object) for name in dimensions},
+                {name: rows[name].to_numpy() for name in metrics}, metrics)
+            writer.write_reports(period.strftime('%Y-%m-%d'), [report])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build weekly, monthly and all-time rollups from the daily store.")
+    parser.add_argument('reports', nargs='*', default=list(NIGHTLY_REPORTS),
+                        help="Reports in the columnar store to roll up")
+    parser.add_argument('--rebuild', action='store_true', help="Drop the existing rollups and start over")
+    args = parser.parse_args()
+
+    for name in args.reports:
+        rollup = Rollup(name)
+        if args.rebuild:
+            rollup.rebuild()
+        updated = rollup.update()
+        logging.info(f"{name}: {updated} changed months rolled up")
+
+
+if __name__ == '__main__':
+    main()
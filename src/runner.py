@@ -0,0 +1,348 @@
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+
+from archive import RawArchive
+from batching import fold_dates, group_dates, page_reports, split_by_date
+from cache import ResponseCache
+from client import build_client
+from columnar import COLUMNAR_DIR, ColumnarWriter
+from decode import decode_response
+from dimension_dictionary import DimensionDictionary
+from excel_sink import ExcelSink
+from fetcher import fetch_shards
+from metrics import RunMetrics, file_size, response_rows
+from pipeline import Pipeline
+from report_specs import NIGHTLY_REPORTS, REPORTS, report_request
+from scheduler import RequestScheduler
+from sinks import CsvSink
+from sqlite_sink import SqliteSink
+from sync import SyncState, rebuild_workbook
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SCOPES = ['https://www.googleapis.com/auth/analytics.readonly']
+KEY_FILE_LOCATION = './client_secrets.json'
+CACHE = ResponseCache()
+SCHEDULER = RequestScheduler()
+METRICS = RunMetrics('runner', cache=CACHE, scheduler=SCHEDULER)
+WORKERS = 4  # Number of shards fetched concurrently
+
+
+def initialize_analyticsreporting():
+    return CACHE.wrap(SCHEDULER.wrap(build_client(KEY_FILE_LOCATION, SCOPES)))
+
+
+def daily(spec):
+    return 'date_range' not in spec and spec['shard_days'] == 1
+
+
+def generate_dates(start_date, end_date):
+    """Yields every 'YYYY-MM-DD' date from start_date to end_date."""
+    current = start_date
+    while current <= end_date:
+        yield current.strftime('%Y-%m-%d')
+        current += timedelta(days=1)
+
+
+def generate_shards(spec, start_date, end_date):
+    """Yields the spec's (start, end) 'YYYY-MM-DD' shards covering start_date..end_date."""
+    if 'date_range' in spec:
+        yield spec['date_range']
+        return
+    current = start_date
+    while current <= end_date:
+        end = min(current + timedelta(days=spec['shard_days'] - 1), end_date)
+        yield current.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+        current = end + timedelta(days=1)
+
+
+def fetch_shard(analytics, names, start, end, metrics=METRICS):
+    """Fetches every named report for one shard.
+
+    Reports over the same range are compatible, so up to five of them go out
+    in each batchGet, each following its own page cursor until exhausted.
+
+    Returns:
+      Dict of report name -> list of single-report page responses.
+    """
+    units = {name: report_request(REPORTS[name], start, end) for name in names}
+    pages = {name: [] for name in names}
+    with metrics.timer('get_report') as sample:
+        for responses, _ in page_reports(analytics, units):
+            for name, response in responses.items():
+                pages[name].append(response)
+        sample.rows = sum(response_rows(response) for responses in pages.values() for response in responses)
+    return pages
+
+
+def fetch_days(analytics, names, dates, metrics=METRICS):
+    """Fetches every named daily report for a run of consecutive days.
+
+    Each report's days are folded into one request with ga:date added (see
+    fold_dates()), and the folded requests share their date range, so up to
+    five days of up to five reports cost one batchGet per page.
+
+    Returns:
+      Dict of date -> report name -> single-day response.
+    """
+    units = {name: fold_dates(report_request(REPORTS[name], dates[0], dates[0]), dates) for name in names}
+    reports = {}
+    rows = {name: [] for name in names}
+    with metrics.timer('get_report') as sample:
+        for responses, _ in page_reports(analytics, units):
+            for name, response in responses.items():
+                reports[name] = response['reports'][0]
+                rows[name].extend(reports[name].get('data', {}).get('rows', []))
+        sample.rows = sum(len(report_rows) for report_rows in rows.values())
+    days = {date: {} for date in dates}
+    for name, report in reports.items():
+        report = dict(report, data=dict(report.get('data', {}), rows=rows[name]))
+        for date, response in split_by_date(report, dates).items():
+            days[date][name] = response
+    return days
+
+
+def is_golden(pages):
+    return all(report.get('data', {}).get('isDataGolden', True)
+               for response in pages for report in response.get('reports', []))
+
+
+class SpecOutputs:
+    """The sinks a spec asked for, opened once for the whole run.
+
+    The workbook covers every day exported so far, not just this run's
+    range, so it's rebuilt from the columnar store on close() rather than
+    written day by day.
+    """
+
+    @staticmethod
+    def paths(spec):
+        """The CSV prefix, archive and workbook paths the spec's file sinks write to."""
+        sinks = spec.get('sinks', ['csv'])
+        prefix = f"{spec['output_dir']}{spec['file_prefix']}"
+        paths = {'csv': f"{prefix}_*.csv", 'archive': f"{spec['output_dir']}json/{spec['file_prefix']}.ndjson.gz",
+                 'excel': f"{prefix}.xlsx"}
+        return [os.path.abspath(path) for sink, path in paths.items() if sink in sinks]
+
+    def __init__(self, name, spec, metrics=METRICS):
+        self.name = name
+        self.spec = spec
+        self.metrics = metrics
+        sinks = spec.get('sinks', ['csv'])
+        self.csv = 'csv' in sinks
+        os.makedirs(spec['output_dir'], exist_ok=True)
+        self.archive = self.excel = self.columns = self.database = None
+        self.days_written = 0
+        if 'archive' in sinks:
+            os.makedirs(f"{spec['output_dir']}json/", exist_ok=True)
+            self.archive = RawArchive(f"{spec['output_dir']}json/{spec['file_prefix']}.ndjson.gz")
+        if 'excel' in sinks:
+            if 'columnar' not in sinks:
+                raise ValueError(f"{name} has an excel sink without the columnar one it's rebuilt from")
+            self.excel = ExcelSink(f"{spec['output_dir']}{spec['file_prefix']}.xlsx",
+                                   sort_column=spec.get('sort_column'))
+        if 'columnar' in sinks:
+            self.columns = ColumnarWriter(COLUMNAR_DIR, name)
+        if 'sqlite' in sinks:
+            self.database = SqliteSink(name)
+
+    @property
+    def typed(self):
+        return bool(self.columns or self.database)
+
+    def write_raw(self, start, end, pages):
+        suffix = start if start == end else f"{start}_{end}"
+        file_name = f"{self.spec['output_dir']}{self.spec['file_prefix']}_{suffix}.csv"
+        if self.csv:
+            # One open, buffered file for every page of the shard, written aside and
+            # swapped in so re-fetching a shard replaces its file instead of appending
+            with self.metrics.timer('write_to_csv', rows=sum(map(response_rows, pages))) as sample:
+                temp_name = f"{file_name}.tmp"
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+                sink = CsvSink(temp_name)
+                for response in pages:
+                    for report in response.get('reports', []):
+                        sink.write_report(report)
+                sink.close()
+                sample.bytes = file_size(temp_name)
+                os.replace(temp_name, file_name)
+        if self.archive:
+            for page_number, response in enumerate(pages):
+                with self.metrics.timer('archive', rows=response_rows(response)) as sample:
+                    sample.bytes = self.archive.append(suffix, page_number, response)
+
+    def write_typed(self, date, reports):
+        rows = sum(len(report) for report in reports)
+        self.days_written += 1
+        if self.columns:
+            with self.metrics.timer('columnar', rows=rows):
+                self.columns.write_reports(date, reports)
+        if self.database:
+            with self.metrics.timer('sqlite', rows=rows):
+                self.database.write_reports(date, reports)
+
+    def close(self, rebuild=True):
+        for sink in (self.archive, self.columns, self.database):
+            if sink:
+                sink.close()
+        if self.excel and not (rebuild and self.days_written):
+            # Nothing new would only rewrite the same workbook, and a failed run keeps the last good one
+            logging.info(f"Leaving {self.excel.file_name} as it is")
+        elif self.excel:
+            # After the columnar writer has flushed its last month
+            with self.metrics.timer('excel_save'):
+                rebuild_workbook(self.excel, COLUMNAR_DIR, self.name, self.excel.sort_column)
+                self.excel.close()
+
+
+def run(names, start_date, end_date, workers=WORKERS, incremental=False, metrics=METRICS):
+    """Runs several report specs in one pass, sharing the client, cache and scheduler.
+
+    Specs with the same shard layout are fetched together, so a nightly run
+    of the daily reports costs one batchGet per five days rather than one
+    per report per day. Dimension values are interned in one
+    DimensionDictionary shared by every spec.
+
+    With incremental, each daily spec only fetches the days after its sync
+    watermark plus the earlier ones GA hadn't finalised yet (see SyncState),
+    and the watermark only moves past a day once every sink has it on disk.
+
+    The sinks and metrics are closed however the run ends, metrics with a
+    'failed' status if it raised.
+    """
+    # Two appenders on one archive or CSV would interleave their writes and corrupt the index
+    owners = {}
+    for name in names:
+        for path in SpecOutputs.paths(REPORTS[name]):
+            if owners.setdefault(path, name) != name:
+                raise ValueError(f"{owners[path]} and {name} both write {path}; run them separately")
+        if incremental and not daily(REPORTS[name]):
+            raise ValueError(f"{name} isn't a daily report, so it can't be synced incrementally")
+    syncs = {name: SyncState(name) for name in names} if incremental else {}
+    outputs = {}
+    status = 'failed'
+    try:
+        try:
+            for name in names:
+                outputs[name] = SpecOutputs(name, REPORTS[name], metrics)
+            _export(outputs, syncs, start_date, end_date, workers, metrics)
+        except BaseException:
+            # What reached the sinks is kept; the workbook and the sync state wait for a run that finishes
+            for output in outputs.values():
+                output.close(rebuild=False)
+            raise
+        for output in outputs.values():
+            output.close()
+        for name, sync in syncs.items():
+            sync.commit()
+            logging.info(f"Synced {name} up to {sync.summary()}")
+        status = 'finished'
+    finally:
+        # So the textfile never goes on saying 'running' after the process is gone
+        metrics.close(status)
+
+
+def _export(outputs, syncs, start_date, end_date, workers, metrics):
+    """Fetches the specs of outputs group by group and feeds their sinks; see run()."""
+    names = list(outputs)
+    dictionary = DimensionDictionary()
+
+    groups = {}
+    for name in names:
+        spec = REPORTS[name]
+        groups.setdefault(spec.get('date_range') or spec['shard_days'], []).append(name)
+    shards = {}
+    for key, group in groups.items():
+        if daily(REPORTS[group[0]]):
+            if syncs:
+                dates = sorted(set().union(*(syncs[name].dates_to_fetch(start_date, end_date) for name in group)))
+                for name in group:
+                    logging.info(f"Incremental sync of {name} ({syncs[name].summary()})")
+            else:
+                dates = list(generate_dates(start_date, end_date))
+            shards[key] = dates
+        else:
+            shards[key] = list(generate_shards(REPORTS[group[0]], start_date, end_date))
+    # Progress is counted in days for daily specs and in shards otherwise, across every group
+    metrics.total = sum(map(len, shards.values()))
+
+    for key, group in groups.items():
+        if daily(REPORTS[group[0]]):
+            batches = fetch_shards(initialize_analyticsreporting,
+                                   lambda analytics, dates: fetch_days(analytics, group, dates, metrics),
+                                   group_dates(shards[key]), workers=workers)
+            results = (((date, date), {name: [days[date][name]] for name in group})
+                       for dates, days in batches for date in dates)
+        else:
+            results = fetch_shards(initialize_analyticsreporting,
+                                   lambda analytics, shard: fetch_shard(analytics, group, *shard, metrics),
+                                   shards[key], workers=workers)
+
+        def write_raw(item):
+            (start, end), pages = item
+            for name in group:
+                outputs[name].write_raw(start, end, pages[name])
+            return item
+
+        def decode(item):
+            (start, end), pages = item
+            # The typed sinks are date-keyed, so only single-day shards feed them
+            decoded = {}
+            if start == end:
+                for name in group:
+                    if outputs[name].typed:
+                        with metrics.timer('decode', rows=sum(map(response_rows, pages[name]))):
+                            decoded[name] = [report for response in pages[name]
+                                             for report in decode_response(response, dictionary)]
+            return start, end, decoded, {name: is_golden(pages[name]) for name in group}
+
+        def write_typed(item):
+            start, end, decoded, golden = item
+            for name, reports in decoded.items():
+                outputs[name].write_typed(start, reports)
+            return start, end, golden
+
+        pipeline = Pipeline(results)
+        pipeline.stage('write_raw', write_raw).stage('decode', decode).stage('write_typed', write_typed)
+        for start, end, golden in pipeline.run():
+            for name, sync in syncs.items():
+                if name in golden:
+                    # ColumnarWriter only writes a month out once the next one starts, so
+                    # the earlier months' days are now on disk in every sink
+                    sync.commit(before_month=start[:7])
+                    sync.record(start, golden[name])
+            metrics.progress()
+            logging.info(f"Finished {', '.join(group)} for {start} to {end}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several report specs in one process.")
+    # No choices=: argparse checks a nargs='*' default against them as a whole list
+    parser.add_argument('reports', nargs='*',
+                        help=f"Report specs to run, from {', '.join(sorted(REPORTS))} "
+                             f"(default: the nightly daily reports)")
+    parser.add_argument('--start', default='2017-05-15', help="First date, YYYY-MM-DD")
+    parser.add_argument('--end', default='2023-08-07', help="Last date, YYYY-MM-DD")
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only fetch days after the last sync, plus earlier days GA hadn't finalised yet")
+    args = parser.parse_args(argv)
+    reports = args.reports or list(NIGHTLY_REPORTS)
+    for name in reports:
+        if name not in REPORTS:
+            parser.error(f"unknown report {name!r} (choose from {', '.join(sorted(REPORTS))})")
+
+    logging.info("Starting script...")
+    run(reports, datetime.strptime(args.start, '%Y-%m-%d'), datetime.strptime(args.end, '%Y-%m-%d'),
+        workers=args.workers, incremental=args.incremental)
+    logging.info(f"Response cache: {CACHE.stats()}")
+    logging.info(f"API quota: {SCHEDULER.stats()}")
+    logging.info("Script finished.")
+
+
+if __name__ == '__main__':
+    main()
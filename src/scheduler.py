@@ -0,0 +1,181 @@
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import date
+
+from checkpoint import atomic_write_json
+
+# Reporting API v4 limits
+# (https://developers.google.com/analytics/devguides/reporting/core/v4/limits-quotas)
+PROJECT_REQUESTS_PER_100S = 2000
+VIEW_REQUESTS_PER_100S = 100  # per view per user
+VIEW_REQUESTS_PER_DAY = 10000
+PROJECT_REQUESTS_PER_DAY = 50000
+VIEW_CONCURRENT_REQUESTS = 10
+
+QUOTA_FILE = '../data/quota.json'
+MAX_RETRIES = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_REASONS = ('RESOURCE_EXHAUSTED', 'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded')
+
+
+class QuotaExhausted(Exception):
+    """Raised when the daily request budget for a view or the project is spent."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens/second up to capacity."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error):
+    """True for 429/5xx and quota/rate errors from googleapiclient (or a fake with the same shape)."""
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        content = getattr(error, 'content', b'') or b''
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        return int(status) in RETRY_STATUSES or (int(status) == 403 and any(r in content for r in RETRY_REASONS))
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class RequestScheduler:
+    """Runs batchGet requests at the fastest rate the Reporting API quotas allow.
+
+    Every request takes a token from the project bucket and from its view's
+    bucket, holds one of the view's concurrent-request slots while in flight
+    and counts against the daily per-view and per-project budgets (persisted
+    in QUOTA_FILE so separate scripts run on the same day share them: each
+    request re-reads the counts under a file lock before adding to them, so
+    concurrent exporters never overwrite each other's usage).
+    Retryable errors are retried with full-jitter exponential backoff.
+    """
+
+    def __init__(self, quota_file=QUOTA_FILE, max_retries=MAX_RETRIES, base_delay=1.0, max_delay=64.0):
+        self.quota_file = quota_file
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.project_bucket = TokenBucket(PROJECT_REQUESTS_PER_100S / 100, PROJECT_REQUESTS_PER_100S / 10)
+        self.view_buckets = {}
+        self.view_slots = {}
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.used = self._load_usage()
+
+    def _load_usage(self):
+        try:
+            with open(self.quota_file, encoding='utf-8') as file:
+                usage = json.load(file)
+        except (FileNotFoundError, ValueError):
+            usage = {}
+        if usage.get('date') != date.today().isoformat():
+            usage = {'date': date.today().isoformat(), 'project': 0, 'views': {}}
+        return usage
+
+    def _view(self, view_id):
+        with self.lock:
+            if view_id not in self.view_buckets:
+                self.view_buckets[view_id] = TokenBucket(VIEW_REQUESTS_PER_100S / 100, VIEW_REQUESTS_PER_100S / 10)
+                self.view_slots[view_id] = threading.BoundedSemaphore(VIEW_CONCURRENT_REQUESTS)
+            return self.view_buckets[view_id], self.view_slots[view_id]
+
+    def _spend(self, view_id):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.quota_file) or '.', exist_ok=True)
+            # A separate lock file, since atomic_write_json replaces the quota file itself
+            with open(f"{self.quota_file}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Pick up what other processes spent since we last looked
+                    self.used = self._load_usage()
+                    if self.used['project'] >= PROJECT_REQUESTS_PER_DAY:
+                        raise QuotaExhausted(f"Project daily quota of {PROJECT_REQUESTS_PER_DAY} requests used up")
+                    if self.used['views'].get(view_id, 0) >= VIEW_REQUESTS_PER_DAY:
+                        raise QuotaExhausted(
+                            f"Daily quota of {VIEW_REQUESTS_PER_DAY} requests for view {view_id} used up")
+                    self.used['project'] += 1
+                    self.used['views'][view_id] = self.used['views'].get(view_id, 0) + 1
+                    atomic_write_json(self.used, self.quota_file)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def remaining(self, view_id):
+        """Requests left today for view_id, taking the project budget into account."""
+        with self.lock:
+            return min(PROJECT_REQUESTS_PER_DAY - self.used['project'],
+                       VIEW_REQUESTS_PER_DAY - self.used['views'].get(view_id, 0))
+
+    def execute(self, request, view_id):
+        """Calls request() under the quotas, retrying retryable failures."""
+        bucket, slots = self._view(view_id)
+        for attempt in range(self.max_retries + 1):
+            self.project_bucket.acquire()
+            bucket.acquire()
+            self._spend(view_id)
+            with slots:
+                try:
+                    return request()
+                except Exception as error:
+                    if attempt == self.max_retries or not is_retryable(error):
+                        raise
+                    last_error = error
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            with self.lock:
+                self.retries += 1
+            logging.warning(f"Retrying view {view_id} request in {delay:.1f}s after: {last_error}")
+            time.sleep(delay)
+
+    def wrap(self, analytics):
+        """Returns analytics with every reports().batchGet().execute() going through the scheduler."""
+        return ScheduledAnalytics(analytics, self)
+
+    def stats(self):
+        return f"{self.used['project']} requests used today, {self.retries} retries"
+
+
+class ScheduledAnalytics:
+    """Drop-in stand-in for the analyticsreporting service that runs requests through a RequestScheduler."""
+
+    def __init__(self, analytics, scheduler):
+        self.analytics = analytics
+        self.scheduler = scheduler
+
+    def reports(self):
+        return self
+
+    def batchGet(self, body):
+        return ScheduledRequest(self, body)
+
+
+class ScheduledRequest:
+    def __init__(self, client, body):
+        self.client = client
+        self.body = body
+
+    def execute(self):
+        view_id = self.body['reportRequests'][0]['viewId']
+        request = self.client.analytics.reports().batchGet(body=self.body)
+        return self.client.scheduler.execute(request.execute, view_id)
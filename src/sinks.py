@@ -0,0 +1,81 @@
+import csv
+import os
+
+CSV_BUFFER_SIZE = 1 << 20
+
+
+def report_header(report):
+    column_header = report.get('columnHeader', {})
+    return column_header.get('dimensions', []) + [
+        entry.get('name') for entry in column_header.get('metricHeader', {}).get('metricHeaderEntries', [])]
+
+
+class CsvSink:
+    """One CSV output, kept open with a large write buffer until close().
+
+    The header is taken from the first report's columnHeader and written
+    once (not at all when appending to a file that already has one); a
+    report with a different layout is refused rather than mixed into the file.
+    """
+
+    def __init__(self, file_name, buffer_size=CSV_BUFFER_SIZE):
+        self.file_name = file_name
+        self.file = open(file_name, mode='a', newline='', encoding='utf-8', buffering=buffer_size)
+        self.writer = csv.writer(self.file)
+        self.needs_header = self.file.tell() == 0
+        self.header = None
+
+    def write_report(self, report):
+        header = report_header(report)
+        if self.header is None:
+            self.header = header
+            if self.needs_header:
+                self.writer.writerow(header)
+        elif header != self.header:
+            raise ValueError(f"{self.file_name} has columns {self.header}, refusing a report with {header}")
+        self.writer.writerows(row.get('dimensions', []) + row.get('metrics', [])[0].get('values', [])
+                              for row in report.get('data', {}).get('rows', []))
+
+    def flush(self):
+        """Pushes buffered rows to the OS, e.g. before a checkpoint measures the file."""
+        self.file.flush()
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class ReportDemux:
+    """Routes every report of a batchGet round to its own sink, in a single pass.
+
+    sinks maps report id (the unit id given to page_reports(), e.g. the spec
+    name) to anything with write_report(report), such as a CsvSink. Reports
+    without a sink are skipped.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, responses):
+        """Writes a dict of report id -> single-report response (as page_reports() yields)."""
+        for report_id, response in responses.items():
+            sink = self.sinks.get(report_id)
+            if sink is not None:
+                for report in response.get('reports', []):
+                    sink.write_report(report)
+
+    def write_response(self, response, report_ids):
+        """Writes a plain batchGet response whose reports are in report_ids order."""
+        for report_id, report in zip(report_ids, response.get('reports', [])):
+            sink = self.sinks.get(report_id)
+            if sink is not None:
+                sink.write_report(report)
+
+    def flush(self):
+        for sink in self.sinks.values():
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
@@ -0,0 +1,145 @@
+import logging
+import os
+import sqlite3
+
+import numpy as np
+
+SQLITE_FILE = '../data/ua_reports.sqlite'
+# SQLite's default limit on host parameters in one statement is 999
+LOOKUP_CHUNK = 500
+
+
+def column_name(name):
+    """Maps a GA column name to an SQL identifier ('ga:pagePath' -> 'pagePath')."""
+    return name[len('ga:'):] if name.startswith('ga:') else name
+
+
+def quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class SqliteSink:
+    """Loads decoded daily reports (see decode.py) into one SQLite database.
+
+    Every dimension gets a normalized table dim_<dimension> (id, value),
+    shared by all reports using it, and each report a WITHOUT ROWID fact
+    table keyed by (date, <dimension>_id, ...) holding its metrics, so rows
+    are clustered by date and a date range is a single B-tree scan. Each
+    dimension also gets a covering index (<dimension>_id, date, metrics...)
+    so "this page over time" never touches the table, and a <report>_view
+    joins the values back in for ad-hoc queries, e.g.
+
+        SELECT pagePath, SUM(pageviews) FROM all_pages_view
+        WHERE date BETWEEN '2021-07-01' AND '2021-09-30'
+        GROUP BY pagePath ORDER BY 2 DESC LIMIT 20
+
+    A day is written in one transaction that replaces whatever was stored
+    for it, inserted with a single executemany upsert on the primary key,
+    so re-fetching a day (a resumed or incremental run) is idempotent. The
+    database runs in WAL mode, letting analysts read while an export writes.
+    """
+
+    def __init__(self, report_name, file_name=SQLITE_FILE):
+        self.report_name = report_name
+        self.file_name = file_name
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        # Used from a pipeline stage thread, one thread at a time
+        self.connection = sqlite3.connect(file_name, timeout=60, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.dimensions = None
+        self.metrics = None
+        self.insert = None
+        self.value_ids = {}
+
+    def _create(self, report):
+        self.dimensions = list(report.dimensions)
+        self.metrics = list(report.metrics)
+        table = quote(self.report_name)
+        key_names = [f"{column_name(name)}_id" for name in self.dimensions]
+        metric_names = [column_name(name) for name in self.metrics]
+        keys = [quote(key) for key in key_names]
+        metrics = [quote(metric) for metric in metric_names]
+        dim_tables = [quote('dim_' + column_name(name)) for name in self.dimensions]
+
+        with self.connection:
+            for dim_table in dim_tables:
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {dim_table} "
+                                        f"(id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)")
+            columns = ['date TEXT NOT NULL'] + [
+                f"{key} INTEGER NOT NULL REFERENCES {dim_table}(id)" for key, dim_table in zip(keys, dim_tables)] + [
+                f"{metric} {'INTEGER' if report.metric_types[name] == 'INTEGER' else 'REAL'}"
+                for metric, name in zip(metrics, self.metrics)]
+            primary_key = ', '.join(['date'] + keys)
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)}, "
+                                    f"PRIMARY KEY ({primary_key})) WITHOUT ROWID")
+
+            stored = [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+            if stored != ['date'] + key_names + metric_names:
+                raise ValueError(f"{self.report_name} in {self.file_name} has columns {stored}, "
+                                 f"refusing a report with {['date'] + key_names + metric_names}")
+
+            for key_name, key in zip(key_names, keys):
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {quote(f'{self.report_name}_by_{key_name}')} "
+                                        f"ON {table} ({', '.join([key, 'date'] + metrics)})")
+            selected = ['r.date'] + [f"d{position}.value AS {quote(column_name(name))}"
+                                     for position, name in enumerate(self.dimensions)] + [
+                f"r.{metric}" for metric in metrics]
+            joins = ''.join(f" JOIN {dim_table} AS d{position} ON d{position}.id = r.{key}"
+                            for position, (key, dim_table) in enumerate(zip(keys, dim_tables)))
+            self.connection.execute(f"CREATE VIEW IF NOT EXISTS {quote(self.report_name + '_view')} AS "
+                                    f"SELECT {', '.join(selected)} FROM {table} AS r{joins}")
+
+        columns = ['date'] + keys + metrics
+        updates = ', '.join(f"{metric} = excluded.{metric}" for metric in metrics) or 'date = excluded.date'
+        self.insert = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                       f"ON CONFLICT ({primary_key}) DO UPDATE SET {updates}")
+
+    def _ids(self, report, dimension):
+        """Returns the dim_<dimension> ids for a report's dimension column, adding any new values."""
+        # Only the distinct values are looked up, as strings; an interned column is already integers
+        uniques, inverse = np.unique(report.dimensions[dimension], return_inverse=True)
+        values = report.values(dimension, uniques).tolist()
+        known = self.value_ids.setdefault(dimension, {})
+        missing = [value for value in values if value not in known]
+        if missing:
+            table = quote('dim_' + column_name(dimension))
+            self.connection.executemany(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)",
+                                        ((value,) for value in missing))
+            for start in range(0, len(missing), LOOKUP_CHUNK):
+                chunk = missing[start:start + LOOKUP_CHUNK]
+                known.update(self.connection.execute(
+                    f"SELECT value, id FROM {table} WHERE value IN ({', '.join('?' * len(chunk))})", chunk))
+        return np.array([known[value] for value in values], dtype=np.int64)[inverse].tolist()
+
+    def write_reports(self, date, reports):
+        """Replaces the stored rows for date with decoded single-day reports."""
+        if self.insert is None and reports:
+            self._create(reports[0])
+        if self.insert is None:
+            return
+        try:
+            self._write(date, reports)
+        except Exception:
+            # Ids cached for values added in the rolled-back transaction are gone too
+            self.value_ids.clear()
+            raise
+
+    def _write(self, date, reports):
+        with self.connection:
+            self.connection.execute(f"DELETE FROM {quote(self.report_name)} WHERE date = ?", (date,))
+            for report in reports:
+                if report.columns != self.dimensions + self.metrics:
+                    raise ValueError(f"{self.report_name} has columns {self.dimensions + self.metrics}, "
+                                     f"refusing a report with {report.columns}")
+                if not len(report):
+                    continue
+                ids = [self._ids(report, name) for name in self.dimensions]
+                values = [report.metrics[name].tolist() for name in self.metrics]
+                self.connection.executemany(self.insert, zip([date] * len(report), *ids, *values))
+
+    def close(self):
+        # Refresh the planner's statistics for the indexes above
+        self.connection.execute('PRAGMA optimize')
+        self.connection.close()
+        logging.info(f"Closed SQLite database: {self.file_name}")
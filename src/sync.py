@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from checkpoint import atomic_write_json
+
+SYNC_DIR = '../data/sync/'
+
+
+class SyncState:
+    """Per-report watermark for incremental daily exports.
+
+    The watermark is the last date that has been exported. Dates exported
+    while GA still flagged them isDataGolden: false are kept as pending and
+    fetched again by later runs until they come back golden, so a nightly
+    run only asks for the new days plus the few trailing ones GA was still
+    reprocessing.
+    """
+
+    def __init__(self, name, sync_dir=SYNC_DIR):
+        os.makedirs(sync_dir, exist_ok=True)
+        self.file_name = os.path.join(sync_dir, f"{name}.json")
+        try:
+            with open(self.file_name, encoding='utf-8') as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            state = {}
+        self.watermark = state.get('watermark')
+        self.pending = set(state.get('pending', []))
+        self.recorded = []
+
+    def dates_to_fetch(self, start_date, end_date=None):
+        """Returns the sorted 'YYYY-MM-DD' dates still to export between start_date and end_date.
+
+        end_date defaults to yesterday, the last day GA has complete data for.
+        """
+        end_date = end_date or datetime.combine(date.today() - timedelta(days=1), datetime.min.time())
+        first = start_date
+        if self.watermark:
+            first = max(start_date, datetime.strptime(self.watermark, '%Y-%m-%d') + timedelta(days=1))
+        dates = {date_str for date_str in self.pending if start_date.strftime('%Y-%m-%d') <= date_str}
+        current = first
+        while current <= end_date:
+            dates.add(current.strftime('%Y-%m-%d'))
+            current += timedelta(days=1)
+        return sorted(dates)
+
+    def record(self, date_str, golden):
+        """Notes a date as exported, pending a re-fetch unless its data was golden.
+
+        Nothing is saved until commit(), so a date only moves the watermark
+        once every sink has it on disk.
+        """
+        self.recorded.append((date_str, golden))
+
+    def commit(self, before_month=None):
+        """Saves the recorded dates, or only those in months before before_month ('YYYY-MM')."""
+        ready = [(date_str, golden) for date_str, golden in self.recorded
+                 if before_month is None or date_str[:7] < before_month]
+        if not ready:
+            return
+        for date_str, golden in ready:
+            if golden:
+                self.pending.discard(date_str)
+            else:
+                self.pending.add(date_str)
+            if not self.watermark or date_str > self.watermark:
+                self.watermark = date_str
+        self.recorded = [entry for entry in self.recorded if entry not in ready]
+        self.save()
+
+    def save(self):
+        atomic_write_json({'watermark': self.watermark, 'pending': sorted(self.pending)}, self.file_name, indent=1)
+
+    def summary(self):
+        return f"watermark {self.watermark}, {len(self.pending)} non-golden dates pending"
+
+
+def rebuild_workbook(excel, root, report_name, sort_column=None):
+    """Refills an ExcelSink from the columnar store, one month partition at a time.
+
+    A workbook can't be patched in place, so incremental runs rebuild it from
+    the columnar copy, which already has the re-fetched days merged in.
+    """
+    import pandas as pd
+
+    from columnar import partitions, read_partition
+
+    for partition in partitions(root, report_name):
+        df = read_partition(partition)
+        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        keys = ['date', sort_column] if sort_column in df.columns else ['date']
+        df = df.sort_values(keys, ascending=[True, False][:len(keys)], kind='stable')
+        month = os.path.basename(partition)[len('month='):]
+        excel.append(month, list(df.columns), df.itertuples(index=False, name=None))
+    logging.info(f"Rebuilt {excel.file_name} from the columnar store")
@@ -0,0 +1,28 @@
+import pytest
+
+import runner
+from report_specs import NIGHTLY_REPORTS
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(runner, 'run', lambda names, start_date, end_date, workers, incremental: calls.append(
+        (names, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), workers, incremental)))
+    return calls
+
+
+def test_main_defaults_to_the_nightly_reports(runs):
+    runner.main([])
+    assert runs == [(list(NIGHTLY_REPORTS), '2017-05-15', '2023-08-07', runner.WORKERS, False)]
+
+
+def test_main_runs_the_named_reports(runs):
+    runner.main(['all_pages', '--start', '2020-01-01', '--end', '2020-01-31', '--workers', '2', '--incremental'])
+    assert runs == [(['all_pages'], '2020-01-01', '2020-01-31', 2, True)]
+
+
+def test_main_rejects_unknown_reports(runs):
+    with pytest.raises(SystemExit):
+        runner.main(['all_pages', 'no_such_report'])
+    assert runs == []
@@ -1,44 +1,26 @@
-from googleapiclient import discovery
-from oauth2client.service_account import ServiceAccountCredentials
 import json
 import csv
 
+from cache import ResponseCache
+from client import build_client
+from report_specs import REPORTS, report_request
+from scheduler import RequestScheduler
+
 SCOPES = ['https://www.googleapis.com/auth/analytics.readonly']
 KEY_FILE_LOCATION = './client_secrets.json'
-VIEW_ID = '150538750'
+CACHE = ResponseCache()
+SCHEDULER = RequestScheduler()
 
 
 def initialize_analyticsreporting():
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(
-        KEY_FILE_LOCATION, SCOPES)
-    analytics = discovery.build('analyticsreporting', 'v4', credentials=credentials)
-    return analytics
+    return CACHE.wrap(SCHEDULER.wrap(build_client(KEY_FILE_LOCATION, SCOPES)))
 
 
 def get_report(analytics, page_token=None):
+    spec = REPORTS['ua_browsers']
     return analytics.reports().batchGet(
         body={
-            "reportRequests": [
-                {
-                    "viewId": VIEW_ID,
-                    "dateRanges": [{"startDate": "2014-11-01", "endDate": "400daysAgo"}],
-                    "metrics": [
-                        {"expression": "ga:pageviews"},
-                        {"expression": "ga:sessions"},
-                        {"expression": "ga:users"},
-                        {"expression": "ga:newUsers"},
-                        {"expression": "ga:bounceRate"},
-                        {"expression": "ga:avgSessionDuration"}
-                    ],
-                    "dimensions": [
-                        {"name": "ga:browser"},
-                        {"name": "ga:country"},
-                        {"name": "ga:date"}
-                    ],
-                    "pageToken": page_token,
-                    "pageSize": 10000  # Adjust this value as necessary
-                }
-            ]
+            "reportRequests": [report_request(spec, *spec['date_range'], page_token)]
         }
     ).execute()
 